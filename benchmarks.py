@@ -0,0 +1,76 @@
+from timeit import default_timer
+from numpy import *
+from numpy.random import *
+from pgf.coordinates import format_coordinates
+from pgf.colormap import colormaps
+from pgf.image import Image
+
+def benchmark(name, func, num_points, repetitions=3, unit='point'):
+	"""
+	Prints the best time per data point (or pixel) out of several runs.
+	"""
+
+	times = []
+	for _ in range(repetitions):
+		start = default_timer()
+		func()
+		times.append(default_timer() - start)
+	print '{0:<40} {1:8.3f} us/{2}'.format(name, min(times) / num_points * 1e6, unit)
+
+
+
+# coordinate serialization
+
+for num_points in [10000, 1000000]:
+	x = randn(num_points)
+	y = randn(num_points)
+	e = rand(num_points)
+	labels = ['a'] * num_points
+
+	print '\n{0} data points\n'.format(num_points)
+
+	benchmark('loop (x, y)', lambda: ''.join(
+		'\t({0}, {1})\n'.format(a, b) for a, b in zip(x, y)), num_points)
+	benchmark('bulk (x, y)', lambda: ''.join(
+		format_coordinates([x, y], '\t({0}, {1})\n')), num_points)
+
+	benchmark('loop (x, y) +- (e, f)', lambda: ''.join(
+		'\t({0}, {1}) +- ({2}, {3})\n'.format(a, b, c, d) for a, b, c, d in zip(x, y, e, e)), num_points)
+	benchmark('bulk (x, y) +- (e, f)', lambda: ''.join(
+		format_coordinates([x, y, e, e], '\t({0}, {1}) +- ({2}, {3})\n')), num_points)
+
+	benchmark('loop (x, y) [label]', lambda: ''.join(
+		'\t({0}, {1}) [{2}]\n'.format(a, b, c) for a, b, c in zip(x, y, labels)), num_points)
+	benchmark('bulk (x, y) [label]', lambda: ''.join(
+		format_coordinates([x, y, labels], '\t({0}, {1}) [{2}]\n')), num_points)
+
+
+
+# colormapped images
+
+def colormap_loop(image, cmap):
+	"""
+	Maps pixels to colors one at a time.
+	"""
+
+	result = zeros(image.shape + (3,), dtype=uint8)
+	for i in range(image.shape[0]):
+		for j in range(image.shape[1]):
+			result[i, j, :] = colormaps[cmap][image[i, j]]
+	return result
+
+for megapixels in [1, 16, 64]:
+	size = 1024 * int(sqrt(megapixels))
+	image = randn(size, size)
+
+	print '\n{0} megapixels\n'.format(megapixels)
+
+	if megapixels == 1:
+		indices = randint(256, size=image.shape)
+		benchmark('loop colormap', lambda: colormap_loop(indices, 'jet'), image.size, 1, 'pixel')
+
+	# images are converted lazily, so the pixels have to be requested
+	benchmark('image (float, jet)', lambda: Image(image, cmap='jet', attach=False).image,
+		image.size, 1, 'pixel')
+
+	del image
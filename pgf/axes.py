@@ -1,8 +1,10 @@
-from utils import indent, escape
+from utils import escape, render_string, significant_digits, Tracked, Writer
 from figure import Figure
-from numpy import min, max, inf, isreal
+from numpy import min, max, inf, isreal, array_equal
+from settings import Settings
+from StringIO import StringIO
 
-class Axes(object):
+class Axes(Tracked):
 	"""
 	Manages axes properties.
 
@@ -150,6 +152,12 @@ class Axes(object):
 	@type clip: boolean/None
 	@ivar clip: if false, plots can extend beyond axes
 
+	@type precision: integer/string/None
+	@ivar precision: significant digits of data points, 'auto' or None (default: L{Settings.precision})
+
+	@type data_tables: boolean/None
+	@ivar data_tables: store plot data in separate files (default: L{Settings.data_tables})
+
 	@type cycle_list: CycleList/list/None
 	@ivar cycle_list: a list of styles used for plots
 
@@ -300,6 +308,19 @@ class Axes(object):
 		self.hide_x_axis = kwargs.get('hide_x_axis', False)
 		self.hide_y_axis = kwargs.get('hide_y_axis', False)
 
+		# significant digits used for data points
+		self.precision = kwargs.get('precision', None)
+
+		# store plot data in separate files
+		self.data_tables = kwargs.get('data_tables', None)
+
+		# tables shared by plots with equal x-values
+		self._tables = []
+
+		# limits and automatic precision and the state they were computed for
+		self._limits = None
+		self._digits = None
+
 		# custom axes properties
 		self.pgf_options = kwargs.get('pgf_options', [])
 
@@ -326,6 +347,17 @@ class Axes(object):
 		@return: LaTeX code for this axis
 		"""
 
+		return render_string(self)
+
+
+	def render_to(self, writer):
+		"""
+		Writes the LaTeX code for this axis.
+
+		@type  writer: L{Writer}
+		@param writer: keeps track of the output stream and indentation
+		"""
+
 		options = [
 			'scale only axis',
 			'width={0}cm'.format(self.width),
@@ -529,25 +561,176 @@ class Axes(object):
 		# custom options
 		options.extend(self.pgf_options)
 
-		tex = '% ' + self.comment + '\n' if self.comment else ''
-		tex += '\\begin{{{0}}}[\n'.format(self.axes_type)
-		tex += indent(',\n'.join(options)) + ']\n'
+		tables = self.tables()
+		context = self._context(tables) if Settings.fragment_cache else None
+
+		if self.comment:
+			writer.write('% ' + self.comment + '\n')
+		for table in tables:
+			self._render_child(table, writer, context)
+		writer.write('\\begin{{{0}}}[\n'.format(self.axes_type))
+		writer.indent()
+		writer.write(',\n'.join(options) + ']\n')
 		for child in self.children:
-			tex += indent(child.render())
-		tex += '\\end{{{0}}}\n'.format(self.axes_type)
+			self._render_child(child, writer, context)
+		writer.dedent()
+		writer.write('\\end{{{0}}}\n'.format(self.axes_type))
+
+
+	def _render_child(self, child, writer, context=None):
+		"""
+		Writes the LaTeX code of a child. If a context is given, the code is
+		kept and reused as long as neither the child nor the context change.
+
+		@type  context: list/None
+		@param context: state on which the LaTeX code of children depends
+		"""
+
+		if context is None or not isinstance(child, Tracked):
+			if hasattr(child, 'render_to'):
+				child.render_to(writer)
+			else:
+				writer.write(child.render())
+			return
+
+		key = [child._version, writer.level, writer.ind, context]
+		fragment = getattr(child, '_fragment', None)
+
+		if fragment is None or fragment[0] != key:
+			stream = StringIO()
+			self._render_child(child, Writer(stream, writer.level, writer.ind))
+			fragment = (key, stream.getvalue())
+			child._fragment = fragment
+
+		writer.write_raw(fragment[1])
+
+
+	def tables(self):
+		"""
+		Finds plots sharing their x-values, i.e., plots referring to the same
+		x-values in memory or plots of the same L{Plot.group} with equal
+		x-values, and assigns them tables of data points. Tables whose plots
+		did not change are reused.
+
+		@rtype: list
+		@return: tables shared by plots of these axes
+		"""
+
+		from plot import Plot
+		from sharedtable import SharedTable, table_name
+
+		groups = {}
+		keys = []
+
+		for child in self.children:
+			if not isinstance(child, Plot):
+				continue
+
+			child._shared = None
+
+			if not child._shareable():
+				continue
+
+			if child.group is not None:
+				key = ('group', child.group, child._data_table())
+			else:
+				key = ('memory', child.xvalues.__array_interface__['data'][0],
+					child.xvalues.shape, child.xvalues.strides, child.xvalues.dtype.str,
+					child._data_table())
+
+			if key not in groups:
+				groups[key] = []
+				keys.append(key)
+			groups[key].append(child)
+
+		tables = []
+
+		for key in keys:
+			plots = groups[key]
+
+			if key[0] == 'group':
+				# only plots with x-values equal to those of the first plot
+				plots = [plot for plot in plots if plot.xvalues is plots[0].xvalues
+					or array_equal(plot.xvalues, plots[0].xvalues)]
+
+			if len(plots) < 2:
+				continue
+
+			name = table_name(len(tables))
+			versions = [plot._version for plot in plots]
 
-		return tex
+			for table in self._tables:
+				if table.plots == plots and table.name == name and table._versions == versions:
+					break
+			else:
+				table = SharedTable(plots, name)
+
+			for plot in plots:
+				plot._shared = table
+			tables.append(table)
+
+		self._tables = tables
+
+		return tables
+
+
+	def _context(self, tables=[]):
+		"""
+		Returns the properties of these axes and settings which affect the
+		LaTeX code of children, e.g. through the precision or size of plots.
+
+		@type  tables: list
+		@param tables: tables shared by plots of these axes
+
+		@rtype: list
+		@return: state on which the LaTeX code of children depends
+		"""
+
+		context = [
+			self.figure,
+			self.width,
+			self.height,
+			self.axes_type,
+			self.xmin,
+			self.xmax,
+			self.ymin,
+			self.ymax,
+			self.zmin,
+			self.zmax,
+			self.precision,
+			self.data_tables,
+			bool(self.cycle_list or self.cycle_list_name),
+			list(tables),
+			sorted((key, value) for key, value in vars(Settings).items()
+				if not key.startswith('_'))]
+
+		# automatic precision depends on the data of all children
+		precision = self.precision if self.precision is not None else Settings.precision
+		if precision == 'auto':
+			context.append(self.digits())
+
+		# so do downsampling, rasterization and cropping of images
+		if any(getattr(child, 'downsample', None) or getattr(child, 'crop', None)
+			or (hasattr(child, '_rasterize') and child._rasterize()) for child in self.children):
+			context.append(self.limits())
+
+		return context
 
 
 	def limits(self):
 		"""
 		Computes the minimum and maximum values over all data points contained in
-		these axes.
+		these axes. The result is reused until the children change.
 
 		@rtype: list
 		@return: [xmin, xmax, ymin, ymax]
 		"""
 
+		state = self._state()
+
+		if self._limits is not None and _same_state(self._limits[0], state):
+			return list(self._limits[1])
+
 		_xmin, _xmax = inf, -inf
 		_ymin, _ymax = inf, -inf
 
@@ -559,9 +742,84 @@ class Axes(object):
 			_ymin = min([_ymin, ymin])
 			_ymax = max([_ymax, ymax])
 
+		self._limits = (state, [_xmin, _xmax, _ymin, _ymax])
+
 		return [_xmin, _xmax, _ymin, _ymax]
 
 
 
+	def digits(self):
+		"""
+		Returns the number of significant digits used to represent x-, y- and
+		z-coordinates of data points. In 'auto' mode, the number of digits is
+		chosen such that rounding errors stay below a tenth of a dot at the
+		resolution given by L{Settings.dpi}. The result is reused until these
+		axes, their children or the resolution change.
+
+		@rtype: list
+		@return: number of digits or None (full precision) for each coordinate
+		"""
+
+		precision = self.precision if self.precision is not None else Settings.precision
+
+		if precision is None:
+			return [None, None, None]
+		if precision != 'auto':
+			return [precision, precision, precision]
+
+		state = self._state() + (self._version, Settings.dpi)
+
+		if self._digits is not None and _same_state(self._digits[0], state):
+			return list(self._digits[1])
+
+		xmin, xmax, ymin, ymax = self.limits()
+		zmin, zmax = self.zmin, self.zmax
+
+		if zmin is None or zmax is None:
+			zvalues = [child.zvalues for child in self.children if hasattr(child, 'zvalues')]
+			if zvalues:
+				zmin = min([min(z) for z in zvalues]) if zmin is None else zmin
+				zmax = max([max(z) for z in zvalues]) if zmax is None else zmax
+
+		digits = [
+			significant_digits(
+				self.xmin if self.xmin is not None else xmin,
+				self.xmax if self.xmax is not None else xmax,
+				self.width, self.axes_type in ['semilogxaxis', 'loglogaxis']),
+			significant_digits(
+				self.ymin if self.ymin is not None else ymin,
+				self.ymax if self.ymax is not None else ymax,
+				self.height, self.axes_type in ['semilogyaxis', 'loglogaxis']),
+			significant_digits(zmin, zmax, self.height)]
+
+		self._digits = (state, digits)
+
+		return list(digits)
+
+
+	def _state(self):
+		"""
+		Returns the children of these axes and their versions, which change
+		whenever the data of a child is replaced.
+
+		@rtype: tuple
+		@return: list of children and list of versions
+		"""
+
+		children = list(self.children)
+		return children, [getattr(child, '_version', None) for child in children]
+
+
 	def __getitem__(self, key):
 		return self.limits()[key]
+
+
+
+def _same_state(state, other):
+	"""
+	Compares states returned by L{Axes._state}, where children are compared by
+	identity rather than by their content.
+	"""
+
+	return len(state[0]) == len(other[0]) and state[1:] == other[1:] \
+		and all(a is b for a, b in zip(state[0], other[0]))
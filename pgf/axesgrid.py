@@ -1,6 +1,7 @@
 from axes import Axes
 from figure import Figure
 from numpy import max, sum, cumsum, asarray
+from utils import render_string
 
 class AxesGrid(object):
 	"""
@@ -83,18 +84,28 @@ class AxesGrid(object):
 
 
 	def render(self):
+		return render_string(self)
+
+
+	def layout(self):
+		"""
+		Positions axes within the grid.
+		"""
+
 		# compute axis positions
 		x_pos, y_pos = [0.], [0.]
 		x_pos.extend(cumsum(asarray(self.widths()) + self.spacing))
 		y_pos.extend(cumsum(asarray(self.heights()) + self.spacing))
 
-		tex = ''
+		for i, j in self.keys():
+			# position axis (only if it moved, so that it is not marked as changed)
+			if list(self[i, j].at) != [x_pos[j], y_pos[i]]:
+				self[i, j].at = [x_pos[j], y_pos[i]]
+
+
+	def render_to(self, writer):
+		self.layout()
 
 		for i, j in self.keys():
-			# position axis
-			self[i, j].at = [x_pos[j], y_pos[i]]
-			
 			# render axis
-			tex += self[i, j].render()
-
-		return tex
+			self[i, j].render_to(writer)
@@ -0,0 +1,128 @@
+from os import path, rename
+from shutil import copyfile, rmtree
+from tempfile import mkdtemp
+from multiprocessing import Pool, cpu_count
+from figure import Figure
+from settings import Settings
+
+# figures of the currently running batch, inherited by worker processes
+_batch = []
+
+def _compile(i):
+	"""
+	Compiles the i-th figure of the current batch in its own build directory.
+	The PDF file is moved to L{Settings.tmp_dir}, where L{Figure.compile}
+	stores it as well, and the build directory is removed.
+
+	@rtype: tuple
+	@return: path to PDF file and None, or None and the error
+	"""
+
+	build_dir = None
+
+	try:
+		build_dir = mkdtemp(prefix='pgf_build_', dir=Settings.tmp_dir)
+		pdf_file = _batch[i].compile(build_dir)
+		result = path.join(Settings.tmp_dir, path.basename(pdf_file))
+		rename(pdf_file, result)
+		return result, None
+	except Exception as error:
+		return None, error
+	finally:
+		if build_dir is not None:
+			rmtree(build_dir, ignore_errors=True)
+
+
+def compile_all(figures=None, workers=None):
+	"""
+	Compiles multiple figures in parallel. Each figure is rendered and compiled
+	by a separate process in its own build directory. Errors are reported per
+	figure and do not stop the remaining figures from being compiled.
+
+	B{Example:}
+
+		>>> results = compile_all(workers=8)
+		>>> failed = [r for r in results if isinstance(r, Exception)]
+
+	@type  figures: list/None
+	@param figures: figures or figure numbers (default: all figures)
+
+	@type  workers: integer/None
+	@param workers: number of processes (default: number of CPUs)
+
+	@rtype: list
+	@return: for each figure, the path to its PDF file or the error which occurred
+	"""
+
+	global _batch
+
+	if figures is None:
+		figures = [Figure._figures[idx] for idx in sorted(Figure._figures.keys())]
+
+	# workers are forked and access the figures without pickling them
+	_batch = [fig if isinstance(fig, Figure) else Figure._figures[fig] for fig in figures]
+
+	if workers is None:
+		workers = cpu_count()
+	workers = min([workers, len(_batch)])
+
+	try:
+		if workers > 1:
+			pool = Pool(workers)
+			try:
+				results = pool.map(_compile, range(len(_batch)), chunksize=1)
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			results = [_compile(i) for i in range(len(_batch))]
+	finally:
+		_batch = []
+
+	return [pdf_file if error is None else error for pdf_file, error in results]
+
+
+def save_all(figures, filenames, workers=None):
+	"""
+	Saves multiple figures, compiling PDF files in parallel. See L{compile_all}.
+
+	@type  figures: list
+	@param figures: figures or figure numbers
+
+	@type  filenames: list
+	@param filenames: a PDF or TeX file location for each figure
+
+	@type  workers: integer/None
+	@param workers: number of processes (default: number of CPUs)
+
+	@rtype: list
+	@return: for each figure, None or the error which occurred
+	"""
+
+	if len(figures) != len(filenames):
+		raise ValueError('The number of filenames should correspond to the number of figures.')
+
+	figures = [fig if isinstance(fig, Figure) else Figure._figures[fig] for fig in figures]
+	errors = [None] * len(figures)
+
+	# PDF files are compiled in parallel, everything else is saved directly
+	indices = [i for i, filename in enumerate(filenames)
+		if path.splitext(filename)[1].lower() == '.pdf']
+
+	for i, result in zip(indices, compile_all([figures[i] for i in indices], workers)):
+		if isinstance(result, Exception):
+			errors[i] = result
+		else:
+			try:
+				copyfile(result, filenames[i])
+			except Exception as error:
+				errors[i] = error
+
+	for i, filename in enumerate(filenames):
+		if i not in indices:
+			try:
+				figures[i].save(filename)
+			except Exception as error:
+				errors[i] = error
+
+	return errors
@@ -1,9 +1,11 @@
 from axes import Axes
 from plot import Plot
 from numpy import asarray, arange, shape, percentile, min, max, logical_or, any
-from numpy import where
+from numpy import repeat, sum
+from utils import render_string, Tracked
+from coordinates import format_value, write_coordinates
 
-class BoxPlot(object):
+class BoxPlot(Tracked):
 	def __init__(self, *args, **kwargs):
 		# data points
 		if len(args) < 1:
@@ -38,10 +40,24 @@ class BoxPlot(object):
 		@return: LaTeX code for this plot
 		"""
 
-		options = []
-		marker_options = []
+		return render_string(self)
 
-		tex = ''
+
+	def render_to(self, writer):
+		"""
+		Writes LaTeX code for this boxplot.
+
+		@type  writer: L{Writer}
+		@param writer: keeps track of the output stream and indentation
+		"""
+
+		xdigits, ydigits, _ = self.axes.digits()
+
+		def x(value):
+			return format_value(value, xdigits)
+
+		def y(value):
+			return format_value(value, ydigits)
 
 		for k in range(len(self.xvalues)):
 			qu1 = percentile(self.yvalues[:, k], 25)
@@ -54,30 +70,46 @@ class BoxPlot(object):
 				self.yvalues[:, k] < qu1 - 1.5 * iqr)
 
 			# median
-			tex += '\\draw[red] (axis cs:{0},{1}) -- (axis cs:{2},{3});\n'.format(
-				self.xvalues[k] - self.box_width / 2., med,
-				self.xvalues[k] + self.box_width / 2., med)
+			writer.write('\\draw[red] (axis cs:{0},{1}) -- (axis cs:{2},{3});\n'.format(
+				x(self.xvalues[k] - self.box_width / 2.), y(med),
+				x(self.xvalues[k] + self.box_width / 2.), y(med)))
 
 			# box
-			tex += '\\draw[blue] (axis cs:{0},{1}) rectangle (axis cs:{2},{3});\n'.format(
-				self.xvalues[k] - self.box_width / 2., qu1,
-				self.xvalues[k] + self.box_width / 2., qu2)
+			writer.write('\\draw[blue] (axis cs:{0},{1}) rectangle (axis cs:{2},{3});\n'.format(
+				x(self.xvalues[k] - self.box_width / 2.), y(qu1),
+				x(self.xvalues[k] + self.box_width / 2.), y(qu2)))
 
 			# whiskers
-			tex += '\\draw[|-, densely dashed] (axis cs:{0},{1}) -- (axis cs:{2},{3});\n'.format(
-				self.xvalues[k], min(self.yvalues[-outlier, k]),
-				self.xvalues[k], qu1)
-			tex += '\\draw[-|, densely dashed] (axis cs:{0},{1}) -- (axis cs:{2},{3});\n'.format(
-				self.xvalues[k], qu2,
-				self.xvalues[k], max(self.yvalues[-outlier, k]))
+			writer.write('\\draw[|-, densely dashed] (axis cs:{0},{1}) -- (axis cs:{2},{3});\n'.format(
+				x(self.xvalues[k]), y(min(self.yvalues[~outlier, k])),
+				x(self.xvalues[k]), y(qu1)))
+			writer.write('\\draw[-|, densely dashed] (axis cs:{0},{1}) -- (axis cs:{2},{3});\n'.format(
+				x(self.xvalues[k]), y(qu2),
+				x(self.xvalues[k]), y(max(self.yvalues[~outlier, k]))))
 
 			if any(outlier):
-				tex += '\\addplot[red, mark=+, only marks] coordinates {\n'
-				for i in where(outlier)[0]:
-					tex += '\t({0}, {1})\n'.format(self.xvalues[k], self.yvalues[i, k])
-				tex += '};\n'
+				writer.write('\\addplot[red, mark=+, only marks] coordinates {\n')
+				write_coordinates(writer,
+					[repeat(self.xvalues[k], sum(outlier)), self.yvalues[outlier, k]],
+					'\t({0}, {1})\n', [xdigits, ydigits])
+				writer.write('};\n')
+
+
+	def _num_plots(self):
+		"""
+		Returns the number of plots taking a place in the cycle list, i.e., the
+		number of boxes with outliers.
+		"""
+
+		if not self.yvalues.size:
+			return 0
+
+		qu1, qu2 = percentile(self.yvalues, [25, 75], axis=0)
+		iqr = qu2 - qu1
+
+		outlier = logical_or(self.yvalues > qu2 + 1.5 * iqr, self.yvalues < qu1 - 1.5 * iqr)
 
-		return tex
+		return int(sum(any(outlier, 0)))
 
 
 	def limits(self):
@@ -0,0 +1,126 @@
+from os import path, makedirs, listdir, remove, rename, utime, getpid
+from shutil import copyfile
+from hashlib import sha1
+from settings import Settings
+
+def cache_key(strings, files=[]):
+	"""
+	Computes a key from strings and the contents of files.
+
+	@type  strings: list
+	@param strings: e.g. LaTeX code and compile command
+
+	@type  files: list
+	@param files: paths of files whose contents determine the result
+
+	@rtype: string
+	@return: hexadecimal hash
+	"""
+
+	key = sha1()
+
+	for string in strings:
+		if isinstance(string, unicode):
+			string = string.encode('utf-8')
+		key.update(str(len(string)) + ':' + string)
+
+	for filename in files:
+		key.update(str(path.basename(filename)) + ':')
+		with open(filename, 'rb') as handle:
+			for chunk in iter(lambda: handle.read(1 << 20), ''):
+				key.update(chunk)
+
+	return key.hexdigest()
+
+
+def cache_directory():
+	"""
+	Returns the directory of the cache and makes sure it exists.
+	"""
+
+	directory = path.join(Settings.tmp_dir, Settings.cache_folder)
+	if not path.exists(directory):
+		makedirs(directory)
+	return directory
+
+
+def cache_load(key, filename, extension='.pdf'):
+	"""
+	Copies a cached file to the given location.
+
+	@type  key: string
+	@param key: key computed with L{cache_key}
+
+	@type  filename: string
+	@param filename: where the cached file will be copied to
+
+	@rtype: boolean
+	@return: true if the cache contained a file for the key
+	"""
+
+	cached = path.join(cache_directory(), key + extension)
+
+	if not path.exists(cached):
+		return False
+
+	try:
+		copyfile(cached, filename)
+	except (IOError, OSError):
+		# file may have been evicted in the meantime
+		return False
+
+	# mark file as recently used
+	utime(cached, None)
+
+	return True
+
+
+def cache_store(key, filename, extension='.pdf'):
+	"""
+	Adds a copy of a file to the cache and evicts the least recently used
+	files if the cache exceeds L{Settings.cache_size}.
+
+	@type  key: string
+	@param key: key computed with L{cache_key}
+
+	@type  filename: string
+	@param filename: file to be stored in the cache
+	"""
+
+	directory = cache_directory()
+	cached = path.join(directory, key + extension)
+
+	# copy first, so that other processes never see incomplete files
+	tmp_file = '{0}.{1}.tmp'.format(cached, getpid())
+	copyfile(filename, tmp_file)
+	rename(tmp_file, cached)
+
+	cache_evict(directory, Settings.cache_size)
+
+
+def cache_evict(directory, size):
+	"""
+	Removes least recently used files until the files in the directory take up
+	at most the given number of bytes.
+	"""
+
+	files = []
+	for name in listdir(directory):
+		if name.endswith('.tmp'):
+			continue
+		try:
+			filename = path.join(directory, name)
+			files.append((path.getmtime(filename), path.getsize(filename), filename))
+		except OSError:
+			pass
+
+	total = sum(entry[1] for entry in files)
+
+	for _, filesize, filename in sorted(files):
+		if total <= size:
+			break
+		try:
+			remove(filename)
+			total -= filesize
+		except OSError:
+			pass
@@ -1,7 +1,7 @@
 from axes import Axes
-from utils import indent
+from utils import indent, Tracked
 
-class Circle(object):
+class Circle(Tracked):
 	def __init__(self, x, y, r, **kwargs):
 		self.x = x
 		self.y = y
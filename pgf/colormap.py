@@ -1,8 +1,12 @@
-from numpy import asarray
+from numpy import asarray, arange, linspace, minimum, round, uint8
 
 class Colormap(object):
 	"""
-	Represents a color map. Each color map is basically a list of 256 RGB values.
+	Represents a color map. Each color map is basically a list of 256 RGB values,
+	which are computed when they are first used.
+
+	@type lut: ndarray
+	@ivar lut: 256 RGB values as a 256x3 array of type uint8
 	"""
 
 	def __init__(self, colors, interp='linear'):
@@ -10,68 +14,150 @@ class Colormap(object):
 		Computes color map. If less than 256 RGB values are given, interpolates
 		linearly between the colors.
 
-		@type  colors: list
+		@type  colors: array_like
 		@param colors: a list of tuples or lists encoding RGB colors
 
 		@type  interp: string
 		@param interp: interpolation ('linear' or 'nearest')
 		"""
 
+		if interp not in ['linear', 'nearest']:
+			raise ValueError('Unknown interpolation \'{0}\'.'.format(interp))
+
+		colors = asarray(colors, dtype=float)
+
+		if colors.ndim != 2 or colors.shape[1] != 3:
+			raise ValueError('Colors should be given as a list of RGB values.')
+
+		self._colors = colors
+		self._interp = interp
+		self._lut = None
+
+
+	@property
+	def lut(self):
+		if self._lut is None:
+			self._lut = self._interpolate(self._colors, self._interp)
+		return self._lut
+
+
+	@property
+	def colors(self):
+		return self.lut
+
+
+	def __getitem__(self, key):
+		return self.lut[key]
+
+
+	def _interpolate(self, colors, interp):
+		"""
+		Returns 256 RGB values of type uint8.
+		"""
+
 		if len(colors) < 256:
-			self.colors = []
+			# position of each entry between given colors
+			j = (len(colors) - 1.) / 255. * arange(256)
+			k = j.astype(int)
+			w = j - k
+
+			# entries at or beyond the last color
+			last = k >= len(colors) - 1
 
 			if interp == 'nearest':
-				for i in range(256):
-					j = (len(colors) - 1.) / 255. * i
-					k = int(j)
-					w = j - k
-
-					if k < len(colors) - 1:
-						if w > 0.5:
-							self.colors.append(colors[k + 1])
-						else:
-							self.colors.append(colors[k])
-					else:
-						self.colors.append(colors[k])
-				
+				colors = colors[k + ((w > 0.5) & ~last)]
 
 			else:
-				for i in range(256):
-					j = (len(colors) - 1.) / 255. * i
-					k = int(j)
-					w = j - k
+				k = minimum(k, len(colors) - 2)
+				w = w[:, None]
+				lut = colors[k] * (1. - w) + colors[k + 1] * w + 0.5
+				lut[last] = colors[-1]
+				colors = lut
 
-					if k < len(colors) - 1:
-						self.colors.append(
-							asarray(colors[k]) * (1. - w) + asarray(colors[k + 1]) * w)
-						self.colors[-1] = asarray(self.colors[-1] + 0.5, 'uint8').tolist()
-					else:
-						self.colors.append(colors[k])
-					
-		else:
-			self.colors = colors
+		return asarray(colors, dtype=uint8)
 
 
 
-	def __getitem__(self, key):
-		return self.colors[key]
+def get_colormap(name):
+	"""
+	Returns a registered or built-in colormap.
+
+	@type  name: string
+	@param name: name of the colormap
+
+	@rtype: Colormap
+	@return: the colormap
+	"""
+
+	try:
+		return colormaps[name]
+	except KeyError:
+		raise ValueError('Unknown colormap \'{0}\'.'.format(name))
+
+
+
+def register_colormap(name, colors, interp='linear'):
+	"""
+	Makes a colormap available under the given name, e.g. for use with
+	L{imshow}. Colors can be given as RGB values between 0 and 255 or as
+	floating point values between 0 and 1. A callable is evaluated at 256
+	points between 0 and 1 and may also return RGBA values, in which case the
+	alpha channel is ignored.
 
+	B{Example:}
 
+		>>> register_colormap('blues', [[255, 255, 255], [0, 0, 255]])
+		>>> register_colormap('viridis', matplotlib.cm.viridis)
+
+	@type  name: string
+	@param name: name of the colormap
+
+	@type  colors: array_like/callable/L{Colormap}
+	@param colors: RGB values or a function mapping values to colors
+
+	@type  interp: string
+	@param interp: interpolation ('linear' or 'nearest')
+
+	@rtype: Colormap
+	@return: the registered colormap
+	"""
 
-colormaps = {
-	'gray': Colormap([
+	if not isinstance(colors, Colormap):
+		if callable(colors):
+			colors = colors(linspace(0., 1., 256))
+
+		colors = asarray(colors)
+
+		if colors.ndim == 2 and colors.shape[1] == 4:
+			# ignore alpha channel
+			colors = colors[:, :3]
+
+		if colors.dtype.kind == 'f' and colors.size and colors.max() <= 1.:
+			colors = round(colors * 255.)
+
+		colors = Colormap(colors, interp)
+
+	colormaps[name] = colors
+
+	return colors
+
+
+
+# built-in colormaps and how they are interpolated
+_builtin = {
+	'gray': ([
 		[0, 0, 0],
 		[255, 255, 255],
-		]),
-	'jet': Colormap([
+		], 'linear'),
+	'jet': ([
 		[0, 0, 144],
 		[0, 0, 255],
 		[0, 255, 255],
 		[255, 255, 0],
 		[255, 0, 0],
 		[128, 0, 0],
-		]),
-	'hsv': Colormap([
+		], 'linear'),
+	'hsv': ([
 		[255, 0, 0],
 		[255, 255, 0],
 		[0, 255, 0],
@@ -79,28 +165,28 @@ colormaps = {
 		[0, 0, 255],
 		[255, 0, 255],
 		[255, 0, 0],
-		]),
-	'winter': Colormap([
+		], 'linear'),
+	'winter': ([
 		[0, 0, 255],
 		[0, 255, 128],
-		]),
-	'cool': Colormap([
+		], 'linear'),
+	'cool': ([
 		[0, 255, 255],
 		[255, 0, 255],
-		]),
-	'hot': Colormap([
+		], 'linear'),
+	'hot': ([
 		[0, 0, 0],
 		[255, 0, 0],
 		[255, 255, 0],
 		[255, 255, 255],
-		]),
-	'cold': Colormap([
+		], 'linear'),
+	'cold': ([
 		[0, 0, 0],
 		[0, 0, 255],
 		[0, 255, 255],
 		[255, 255, 255],
-		]),
-	'cartoon': Colormap([
+		], 'linear'),
+	'cartoon': ([
 		[255, 255, 255],
 		[0, 0, 255],
 		[0, 42, 255],
@@ -111,7 +197,7 @@ colormaps = {
 		[252, 164, 0],
 		[209, 0, 0],
 		], 'nearest'),
-	'shadows': Colormap([
+	'shadows': ([
 		[255, 255, 255],
 		[223, 223, 223],
 		[191, 191, 191],
@@ -122,11 +208,14 @@ colormaps = {
 		[31, 31, 31],
 		[0, 0, 0],
 		], 'nearest'),
-	'fruity': Colormap([
+	'fruity': ([
 		[255, 255, 255],
 		[ 50,  50, 230],
 		[100, 230,  50],
 		[230, 230,  50],
 		[255,  50,  50]
-		]),
+		], 'linear'),
 }
+
+# colormaps by name
+colormaps = dict((name, Colormap(*args)) for name, args in _builtin.items())
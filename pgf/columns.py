@@ -0,0 +1,195 @@
+from numpy import load, loadtxt, asarray, ndarray
+from os import path
+
+# names of column separators in PGFPlots
+col_seps = {
+	',': 'comma',
+	';': 'semicolon',
+	':': 'colon',
+	'\t': 'tab',
+	' ': 'space',
+	None: 'space',
+}
+
+# lines starting with these characters are ignored
+comments = ['#', '%']
+
+def is_csv(data):
+	"""
+	Returns true if data refers to a text file containing a table.
+	"""
+
+	return isinstance(data, str) \
+		and path.splitext(data)[1].lower() not in ['.npy', '.npz']
+
+
+def read_columns(data, keys, delimiter=','):
+	"""
+	Reads columns of a table. Fields of structured arrays are returned as
+	views, NumPy files are memory-mapped where possible (.npy) and only the
+	requested arrays of archives (.npz) are loaded.
+
+	B{Examples:}
+
+		>>> x, y = read_columns('metrics.npz', ['time', 'loss'])
+		>>> x, y = read_columns('metrics.csv', ['time', 'loss'])
+		>>> x, y = read_columns(records, ['time', 'loss'])
+		>>> x, y = read_columns(matrix, [0, 1])
+
+	@type  data: string/ndarray/dict
+	@param data: path to a .npy, .npz or CSV file, a structured or two-dimensional array or a mapping
+
+	@type  keys: list
+	@param keys: names or indices of columns
+
+	@type  delimiter: string/None
+	@param delimiter: column separator of CSV files (None means whitespace)
+
+	@rtype: list
+	@return: one array per column
+	"""
+
+	if is_csv(data):
+		return CSVTable(data, delimiter).read(keys)
+
+	if isinstance(data, str):
+		if path.splitext(data)[1].lower() == '.npz':
+			with load(data) as archive:
+				return _select(archive, keys)
+		return _select(load(data, mmap_mode='r'), keys)
+
+	return _select(data, keys)
+
+
+def _select(data, keys):
+	columns = []
+
+	for key in keys:
+		try:
+			if isinstance(data, ndarray) and data.dtype.names is None:
+				# columns of a matrix
+				columns.append(data[:, key])
+			else:
+				columns.append(asarray(data[key]))
+		except (KeyError, ValueError, IndexError):
+			raise ValueError('Unknown column \'{0}\'.'.format(key))
+
+	return columns
+
+
+
+class CSVTable(object):
+	"""
+	A text file containing a table, whose values are only parsed when they
+	are needed. Columns are identified by their name if the first line of the
+	file is a header, or else by their index.
+
+	@type filename: string
+	@ivar filename: path to the file
+
+	@type delimiter: string/None
+	@ivar delimiter: column separator (None means whitespace)
+
+	@type names: list/None
+	@ivar names: column names or None if the file has no header
+	"""
+
+	def __init__(self, filename, delimiter=','):
+		if delimiter not in col_seps:
+			raise ValueError('Unknown delimiter \'{0}\'.'.format(delimiter))
+
+		self.filename = filename
+		self.delimiter = delimiter
+		self.names = None
+
+		# number of lines preceding the data
+		self._skip = 0
+
+		with open(filename) as handle:
+			for line in handle:
+				self._skip += 1
+
+				if not line.strip() or line.lstrip()[0] in comments:
+					continue
+
+				fields = [field.strip() for field in line.split(delimiter)]
+
+				try:
+					[float(field) for field in fields]
+					self._skip -= 1
+				except ValueError:
+					# like PGFPlots, treat lines with non-numeric entries as header
+					self.names = fields
+				break
+
+
+	def index(self, key):
+		"""
+		Returns the index of a column.
+
+		@type  key: string/integer
+		@param key: name or index of the column
+
+		@rtype: integer
+		@return: index of the column
+		"""
+
+		if isinstance(key, str):
+			if self.names is None or key not in self.names:
+				raise ValueError('Unknown column \'{0}\'.'.format(key))
+			return self.names.index(key)
+		return key
+
+
+	def read(self, keys):
+		"""
+		Parses the given columns.
+
+		@type  keys: list
+		@param keys: names or indices of columns
+
+		@rtype: list
+		@return: one array per column
+		"""
+
+		indices = [self.index(key) for key in keys]
+		usecols = sorted(set(indices))
+
+		values = loadtxt(self.filename, delimiter=self.delimiter, comments=comments,
+			skiprows=self._skip, usecols=usecols, ndmin=2)
+
+		return [values[:, usecols.index(i)] for i in indices]
+
+
+	def option(self, option, key):
+		"""
+		Returns a PGFPlots table option referring to a column.
+
+		B{Example:}
+
+			>>> table.option('y error', 'loss_std')
+			'y error={loss_std}'
+
+		@type  option: string
+		@param option: e.g. 'x', 'y', 'x error' or 'y error'
+
+		@type  key: string/integer
+		@param key: name or index of the column
+		"""
+
+		if isinstance(key, str):
+			return '{0}={{{1}}}'.format(option, key)
+		return '{0} index={1}'.format(option, self.index(key))
+
+
+	def options(self):
+		"""
+		Returns PGFPlots options needed to read this file.
+
+		@rtype: list
+		@return: table options
+		"""
+
+		return [
+			'col sep={0}'.format(col_seps[self.delimiter]),
+			'header={0}'.format('true' if self.names is not None else 'false')]
@@ -0,0 +1,158 @@
+from numpy import empty, asarray
+from multiprocessing import Pool, cpu_count, current_process
+from settings import Settings
+
+# number of data points formatted at once
+chunk_size = 10000
+
+# number of data points formatted by a process at once
+block_size = 200000
+
+# columns and format string of the current parallel job, inherited by worker processes
+_job = None
+
+def format_value(value, precision=None):
+	"""
+	Formats a single value.
+
+	@type  value: float
+	@param value: the value to be formatted
+
+	@type  precision: integer/None
+	@param precision: number of significant digits or None for full precision
+
+	@rtype: string
+	@return: string representation of the value
+	"""
+
+	if precision is None:
+		return '{0}'.format(value)
+	return '{0:.{1}g}'.format(value, precision)
+
+
+def format_coordinates(columns, template, prefix='', precision=None):
+	"""
+	Formats data points in bulk. Instead of formatting one value at a time,
+	the columns are interleaved chunk-wise and each chunk is formatted with a
+	single string operation. Chunks are generated one after another so that
+	the full output never has to be kept in memory. With more than
+	L{Settings.format_threshold} data points, blocks of data points are
+	formatted in parallel by L{Settings.format_processes} processes, provided
+	there is more than one CPU and no images are being encoded by threads.
+	In L{Figure.compile}, this means data files written while images are
+	still being encoded are formatted by a single process.
+
+	B{Example:}
+
+		>>> ''.join(format_coordinates([[1, 2], [3, 4]], '({0}, {1})\\n'))
+		'(1, 3)\\n(2, 4)\\n'
+
+	@type  columns: list
+	@param columns: arrays or lists of equal length, e.g. x and y values
+
+	@type  template: string
+	@param template: format of one data point with one placeholder per column
+
+	@type  prefix: string
+	@param prefix: string inserted at the beginning of each line
+
+	@type  precision: integer/list/None
+	@param precision: significant digits of all or of each column; None means full precision
+
+	@rtype: generator
+	@return: formatted chunks of data points
+	"""
+
+	if not columns:
+		return
+
+	columns = [column if isinstance(column, list) else asarray(column) for column in columns]
+
+	if not isinstance(precision, list):
+		precision = [precision] * len(columns)
+
+	# turn template into %-style format string
+	fmt = prefix + template.replace('%', '%%').format(
+		*['%s' if p is None else '%.{0}g'.format(p) for p in precision])
+
+	num_points = len(columns[0])
+
+	processes = Settings.format_processes or cpu_count()
+
+	from figure import Encoding
+
+	# forking a process while threads encoding images hold locks may deadlock
+	# the child, and a single CPU gains nothing
+	if num_points < Settings.format_threshold or processes < 2 or cpu_count() < 2 \
+		or current_process().daemon or Encoding.running():
+		for chunk in _format_range(columns, fmt, 0, num_points):
+			yield chunk
+		return
+
+	global _job
+
+	# workers are forked and access the columns without pickling them
+	_job = (columns, fmt)
+
+	try:
+		pool = Pool(processes)
+	finally:
+		_job = None
+
+	try:
+		for start in range(0, num_points, processes * block_size):
+			stop = min(start + processes * block_size, num_points)
+
+			# no blocks are in flight while chunks are consumed, so that the pool
+			# can be shut down cleanly if the consumer fails or stops early
+			for chunk in pool.map(_format_block, range(start, stop, block_size), chunksize=1):
+				yield chunk
+	finally:
+		pool.close()
+		pool.join()
+
+
+def _format_range(columns, fmt, start, stop):
+	"""
+	Formats data points from start to stop in chunks of L{chunk_size}.
+	"""
+
+	for i in range(start, stop, chunk_size):
+		num = min(chunk_size, stop - i)
+
+		# interleave columns; object arrays hold Python scalars
+		values = empty([num, len(columns)], dtype=object)
+		for j, column in enumerate(columns):
+			values[:, j] = column[i:i + num]
+
+		yield (fmt * num) % tuple(values.ravel().tolist())
+
+
+def _format_block(start):
+	"""
+	Formats a block of data points of the current parallel job.
+	"""
+
+	columns, fmt = _job
+	return ''.join(_format_range(columns, fmt, start, min(start + block_size, len(columns[0]))))
+
+
+def write_coordinates(writer, columns, template, precision=None):
+	"""
+	Writes data points using the writer's current indentation.
+
+	@type  writer: L{Writer}
+	@param writer: keeps track of the output stream and indentation
+
+	@type  columns: list
+	@param columns: arrays or lists of equal length, e.g. x and y values
+
+	@type  template: string
+	@param template: format of one data point with one placeholder per column
+
+	@type  precision: integer/list/None
+	@param precision: significant digits of all or of each column; None means full precision
+	"""
+
+	for chunk in format_coordinates(columns, template, writer.prefix, precision):
+		writer.write_raw(chunk)
@@ -0,0 +1,162 @@
+from numpy import asarray, arange, floor, clip, lexsort, flatnonzero, diff, unique
+from numpy import concatenate, minimum, maximum, argmin, argmax, abs, mean, empty, r_
+from numpy import searchsorted
+
+def m4(xvalues, yvalues, xmin, xmax, num_columns):
+	"""
+	Selects the data points which determine how a line looks when drawn with a
+	limited number of pixel columns. For each column, the first and last data
+	point as well as the data points with minimal and maximal y-value are kept
+	(M4 aggregation). Data points left and right of the axis are collected in
+	two additional columns.
+
+	@type  xvalues: array_like
+	@param xvalues: x-coordinates of data points
+
+	@type  yvalues: array_like
+	@param yvalues: y-coordinates of data points
+
+	@type  xmin: float
+	@param xmin: lower limit of the visible x-range
+
+	@type  xmax: float
+	@param xmax: upper limit of the visible x-range
+
+	@type  num_columns: integer
+	@param num_columns: number of pixel columns
+
+	@rtype: ndarray
+	@return: sorted indices of selected data points
+	"""
+
+	xvalues = asarray(xvalues)
+	yvalues = asarray(yvalues)
+
+	if len(xvalues) <= 4 * num_columns or not xmax > xmin:
+		return arange(len(xvalues))
+
+	columns = floor((xvalues - xmin) / float(xmax - xmin) * num_columns)
+	columns = clip(columns, -1, num_columns).astype(int)
+
+	# sort by column, then by y-value
+	order = lexsort((yvalues, columns))
+	starts = flatnonzero(r_[True, diff(columns[order]) != 0])
+	ends = r_[starts[1:], len(order)] - 1
+
+	return unique(concatenate([
+		minimum.reduceat(order, starts),
+		maximum.reduceat(order, starts),
+		order[starts],
+		order[ends]]))
+
+
+def lttb(xvalues, yvalues, xmin, xmax, num_columns):
+	"""
+	Selects data points using the largest-triangle-three-buckets algorithm,
+	which keeps two data points per pixel column. Only the visible data points
+	and their direct neighbours are divided into buckets. Like in L{m4}, of
+	the data points left and right of the axis, only the first, the last and
+	those with minimal and maximal y-value are kept. Data points are assumed to
+	be sorted by their x-coordinates.
+
+	@type  xvalues: array_like
+	@param xvalues: x-coordinates of data points
+
+	@type  yvalues: array_like
+	@param yvalues: y-coordinates of data points
+
+	@type  xmin: float
+	@param xmin: lower limit of the visible x-range
+
+	@type  xmax: float
+	@param xmax: upper limit of the visible x-range
+
+	@type  num_columns: integer
+	@param num_columns: number of pixel columns
+
+	@rtype: ndarray
+	@return: sorted indices of selected data points
+	"""
+
+	xvalues = asarray(xvalues, dtype=float)
+	yvalues = asarray(yvalues, dtype=float)
+
+	if not xmax > xmin:
+		return _lttb(xvalues, yvalues, 2 * num_columns)
+
+	# visible data points and one neighbour on each side
+	start = max([searchsorted(xvalues, xmin, 'left') - 1, 0])
+	stop = min([searchsorted(xvalues, xmax, 'right') + 1, len(xvalues)])
+
+	return unique(concatenate([
+		_extremes(yvalues, 0, start),
+		start + _lttb(xvalues[start:stop], yvalues[start:stop], 2 * num_columns),
+		_extremes(yvalues, stop, len(yvalues))]))
+
+
+def _extremes(yvalues, start, stop):
+	"""
+	Returns the indices of the first and last data point of a range and of
+	the data points with minimal and maximal y-value.
+	"""
+
+	if stop <= start:
+		return arange(0)
+
+	return asarray([
+		start,
+		stop - 1,
+		start + argmin(yvalues[start:stop]),
+		start + argmax(yvalues[start:stop])])
+
+
+def _lttb(xvalues, yvalues, num_points):
+	"""
+	Selects data points using the largest-triangle-three-buckets algorithm.
+	Data points are assumed to be sorted by their x-coordinates.
+
+	@type  xvalues: array_like
+	@param xvalues: x-coordinates of data points
+
+	@type  yvalues: array_like
+	@param yvalues: y-coordinates of data points
+
+	@type  num_points: integer
+	@param num_points: number of data points to select
+
+	@rtype: ndarray
+	@return: sorted indices of selected data points
+	"""
+
+	xvalues = asarray(xvalues, dtype=float)
+	yvalues = asarray(yvalues, dtype=float)
+
+	if len(xvalues) <= num_points or num_points < 3:
+		return arange(len(xvalues))
+
+	# buckets between first and last data point
+	edges = floor(arange(num_points - 1) * (len(xvalues) - 2.) / (num_points - 2) + 1).astype(int)
+	edges[-1] = len(xvalues) - 1
+
+	indices = empty(num_points, dtype=int)
+	indices[0] = 0
+	indices[-1] = len(xvalues) - 1
+
+	for i in range(num_points - 2):
+		a = indices[i]
+
+		# average of next bucket
+		if i < num_points - 3:
+			x_next = mean(xvalues[edges[i + 1]:edges[i + 2]])
+			y_next = mean(yvalues[edges[i + 1]:edges[i + 2]])
+		else:
+			x_next = xvalues[-1]
+			y_next = yvalues[-1]
+
+		# pick data point which forms the largest triangle
+		x = xvalues[edges[i]:edges[i + 1]]
+		y = yvalues[edges[i]:edges[i + 1]]
+		areas = abs((xvalues[a] - x_next) * (y - yvalues[a]) - (xvalues[a] - x) * (y_next - yvalues[a]))
+		indices[i + 1] = edges[i] + argmax(areas)
+
+	return indices
@@ -1,7 +1,13 @@
-from os import path, system, mkdir
-from utils import min_free, indent
+from os import path, system, mkdir, remove, rename
+from utils import min_free, Writer, render_string
 from settings import Settings
+from cache import cache_key, cache_load, cache_store
+from preamble import build_format, format_directory
+from worker import Worker
 from numpy.random import randint
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from weakref import WeakSet
 
 class Figure(object):
 	"""
@@ -81,6 +87,20 @@ class Figure(object):
 			self._initialized = True
 
 
+	def close(self):
+		"""
+		Removes the figure from the list of figures, so that it and its data
+		can be garbage collected once it is no longer referenced elsewhere.
+		"""
+
+		if Figure._figures.get(self._idx) is self:
+			del Figure._figures[self._idx]
+
+		if Figure._cf is self:
+			# move focus to the most recently created remaining figure
+			Figure._cf = Figure._figures[max(Figure._figures)] if Figure._figures else None
+
+
 	def render(self):
 		"""
 		Creates and returns LaTeX code for this figure.
@@ -89,6 +109,42 @@ class Figure(object):
 		@return: LaTeX code for this figure
 		"""
 
+		return render_string(self)
+
+
+	def preamble(self):
+		"""
+		Returns the packages and macros loaded by this figure.
+
+		@rtype: string
+		@return: LaTeX code used in the preamble
+		"""
+
+		preamble = Settings.preamble
+
+		if self.sans_serif:
+		   preamble = preamble + \
+			'\\usepackage[T1]{fontenc}\n' + \
+			'\\usepackage{helvet}\n' + \
+			'\\renewcommand{\\familydefault}{\\sfdefault}\n' + \
+			'\\usepackage{sfmath}\n'
+
+		return preamble
+
+
+	def render_to(self, stream, externals=None):
+		"""
+		Writes LaTeX code for this figure to a file-like object.
+
+		@type  stream: file/L{Writer}
+		@param stream: where the LaTeX code is written to
+
+		@type  externals: dict/None
+		@param externals: PDF files which replace the LaTeX code of axes
+		"""
+
+		writer = stream if isinstance(stream, Writer) else Writer(stream)
+
 		# figure width and height
 		width, height = self.width, self.height
 
@@ -105,70 +161,212 @@ class Figure(object):
 			if not height:
 				height = self.margin * 2. + 1.
 
-		preamble = Settings.preamble
-
-		if self.sans_serif:
-		   preamble = preamble + \
-			'\\usepackage[T1]{fontenc}\n' + \
-			'\\usepackage{helvet}\n' + \
-			'\\renewcommand{\\familydefault}{\\sfdefault}\n' + \
-			'\\usepackage{sfmath}\n'
-
-		tex = \
-			'\\documentclass{article}\n' + \
-			'\n' + \
-			preamble + \
-			'\n' + \
-			'\\usepackage[\n' + \
-			'\tmargin=0cm,\n' + \
-			'\tpaperwidth={0}cm,\n'.format(width) + \
-			'\tpaperheight={0}cm]{{geometry}}\n'.format(height) + \
-			'\n' + \
-			'\\begin{document}\n' + \
-			'\t\\thispagestyle{empty}\n' + \
-			'\n'
+		writer.write(self._header(width, height))
 		if self.axes:
-			tex += \
+			writer.write(
 				'\t\\begin{figure}\n' + \
 				'\t\t\\centering\n' + \
-				'\t\t\\begin{tikzpicture}\n'
-			for ax in self.axes:
-				tex += indent(ax.render(), 3)
-			tex += \
+				'\t\t\\begin{tikzpicture}\n')
+			writer.indent(3)
+			if externals is None:
+				for ax in self.axes:
+					ax.render_to(writer)
+			else:
+				for ax in self._axes():
+					# place axes such that the margins of the PDF files surround them
+					writer.write(
+						'\\node[anchor=south west, inner sep=0] at ({0}cm, {1}cm) {{\\includegraphics{{{2}}}}};\n'.format(
+							ax.at[0] - self.margin, ax.at[1] - self.margin, externals[ax]))
+			writer.dedent(3)
+			writer.write(
 				'\t\t\\end{tikzpicture}\n' + \
-				'\t\\end{figure}\n'
+				'\t\\end{figure}\n')
 		else:
-			tex += '\t\\mbox{}\n'
-		tex += '\\end{document}'
-
-		return tex
+			writer.write('\t\\mbox{}\n')
+		writer.write('\\end{document}')
 
 
-	def compile(self):
+	def compile(self, build_dir=None):
 		"""
-		Generates LaTeX code and tries to compile it into a PDF file.
+		Generates LaTeX code and tries to compile it into a PDF file. If
+		L{Settings.cache} is enabled and the same LaTeX code, images and data
+		were compiled before, the cached PDF file is used instead.
+
+		If L{Settings.externalize} is enabled, each axes is compiled into its
+		own PDF file, which is reused as long as the axes does not change.
+
+		@type  build_dir: string/None
+		@param build_dir: where to compile the figure (default: L{Settings.tmp_dir})
 
 		@rtype: string
 		@return: path to PDF file
 		"""
 
-		self.save_images(Settings.tmp_dir)
+		if build_dir is None:
+			build_dir = Settings.tmp_dir
 
-		tex_file = path.join(Settings.tmp_dir, 'pgf_{0}_{1}.tex'.format(Figure._session, self._idx))
-		pdf_file = path.join(Settings.tmp_dir, 'pgf_{0}_{1}.pdf'.format(Figure._session, self._idx))
+		# encode images while LaTeX code is generated
+		images = self.save_images(build_dir, wait=False)
 
-		command = Settings.pdf_compile.format('-output-directory {0} {1}')
-		command = command.format(Settings.tmp_dir, tex_file)
+		self.save_data(build_dir)
+
+		if images is not None and Settings.externalize:
+			images.get()
+
+		externals = self._externalize(build_dir) if Settings.externalize else None
+
+		tex_file = path.join(build_dir, 'pgf_{0}_{1}.tex'.format(Figure._session, self._idx))
+		pdf_file = path.join(build_dir, 'pgf_{0}_{1}.pdf'.format(Figure._session, self._idx))
 
 		# write LaTeX file
 		with open(tex_file, 'w') as handle:
-			handle.write(self.render())
+			self.render_to(handle, externals)
+
+		if images is not None:
+			images.get()
+
+		if externals is None:
+			files = [path.join(build_dir, f) for f in self._files()]
+		else:
+			files = [path.join(build_dir, f) for f in externals.values()]
+
+		if Settings.cache:
+			key = cache_key([Settings.preamble, Settings.pdf_compile], [tex_file] + files)
+
+			if cache_load(key, pdf_file):
+				return pdf_file
+
+		self._compile_tex(tex_file, build_dir)
+
+		if Settings.cache:
+			cache_store(key, pdf_file)
+
+		return pdf_file
+
+
+	def _compile_tex(self, tex_file, build_dir):
+		"""
+		Compiles a LaTeX file using this figure's preamble into a PDF file of
+		the same name.
+		"""
+
+		pdf_file = path.splitext(tex_file)[0] + '.pdf'
+
+		if Settings.tex_worker:
+			# compile with TeX process which has already loaded the preamble
+			Worker.run(self.preamble(), build_dir, tex_file, pdf_file)
+			return
+
+		command = Settings.pdf_compile.format('-output-directory {0} {1}')
+		command = command.format(build_dir, tex_file)
+
+		if Settings.precompile_preamble:
+			fmt = build_format(tex_file, self.preamble())
+
+			if fmt is not None:
+				# load preamble from precompiled format
+				command = Settings.pdf_compile.format('-fmt={2} -output-directory {0} {1}')
+				command = 'TEXFORMATS="{0}:$TEXFORMATS" '.format(format_directory()) + \
+					command.format(build_dir, tex_file, fmt)
 
 		# compile
-		if system('cd "{0}" && {1}'.format(Settings.tmp_dir, command)):
+		if system('cd "{0}" && {1}'.format(build_dir, command)):
 			raise RuntimeError('Compiling TeX source file to PDF failed.')
 
-		return pdf_file
+
+	def _externalize(self, build_dir):
+		"""
+		Compiles each axes into a PDF file named after a hash of its LaTeX code,
+		images and data. Axes whose PDF file already exists in the build
+		directory or in the cache are not compiled again.
+
+		@rtype: dict
+		@return: PDF file of each axes, relative to the build directory
+		"""
+
+		externals = {}
+
+		for ax in self._axes():
+			tex_file = path.join(build_dir, 'pgf_{0}_{1}_axes.tex'.format(Figure._session, self._idx))
+
+			with open(tex_file, 'w') as handle:
+				self._render_axes(ax, handle)
+
+			key = cache_key([Settings.pdf_compile],
+				[tex_file] + [path.join(build_dir, f) for f in self._files(ax.children)])
+
+			filename = 'pgf_axes_{0}'.format(key)
+			externals[ax] = filename + '.pdf'
+
+			if path.exists(path.join(build_dir, externals[ax])):
+				remove(tex_file)
+				continue
+
+			if Settings.cache and cache_load(key, path.join(build_dir, externals[ax])):
+				remove(tex_file)
+				continue
+
+			rename(tex_file, path.join(build_dir, filename + '.tex'))
+
+			self._compile_tex(path.join(build_dir, filename + '.tex'), build_dir)
+
+			if Settings.cache:
+				cache_store(key, path.join(build_dir, externals[ax]))
+
+		return externals
+
+
+	def _render_axes(self, ax, stream):
+		"""
+		Writes a LaTeX document containing only the given axes. The page covers
+		the axes and the figure's margin around it.
+		"""
+
+		writer = Writer(stream)
+
+		writer.write(self._header(
+			ax.width + self.margin * 2.,
+			ax.height + self.margin * 2.))
+		writer.write(
+			'\t\\noindent\n' + \
+			'\t\\begin{tikzpicture}\n' + \
+			'\t\t\\useasboundingbox ({0}cm, {1}cm) rectangle ({2}cm, {3}cm);\n'.format(
+				ax.at[0] - self.margin,
+				ax.at[1] - self.margin,
+				ax.at[0] + ax.width + self.margin,
+				ax.at[1] + ax.height + self.margin))
+		writer.indent(2)
+		ax.render_to(writer)
+		writer.dedent(2)
+		writer.write(
+			'\t\\end{tikzpicture}\n' + \
+			'\\end{document}')
+
+
+	def _header(self, width, height):
+		"""
+		Returns the LaTeX code up to the beginning of the document.
+		"""
+
+		preamble = self.preamble()
+
+		if Settings.precompile_preamble or Settings.tex_worker:
+			# everything up to here is loaded from a precompiled format or by a worker
+			preamble = preamble + '\\csname endofdump\\endcsname\n'
+
+		return \
+			'\\documentclass{article}\n' + \
+			'\n' + \
+			preamble + \
+			'\n' + \
+			'\\usepackage[\n' + \
+			'\tmargin=0cm,\n' + \
+			'\tpaperwidth={0}cm,\n'.format(width) + \
+			'\tpaperheight={0}cm]{{geometry}}\n'.format(height) + \
+			'\n' + \
+			'\\begin{document}\n' + \
+			'\t\\thispagestyle{empty}\n' + \
+			'\n'
 
 
 	def draw(self):
@@ -206,31 +404,203 @@ class Figure(object):
 
 		elif format == 'tex':
 			self.save_images(path.dirname(filename))
+			self.save_data(path.dirname(filename))
 
 			# save TeX file
 			with open(filename, 'w') as handle:
-				handle.write(self.render())
+				self.render_to(handle)
+
 
 
+	def save_images(self, filepath, wait=True):
+		"""
+		Writes all images and rasterized plots. Images are encoded in parallel
+		by L{Settings.image_threads} threads.
+
+		@type  filepath: string
+		@param filepath: directory containing the image folder
+
+		@type  wait: boolean
+		@param wait: if false, returns before images have been written
+
+		@rtype: L{Encoding}/None
+		@return: if wait is false, call C{get()} to wait for images to be written
+		"""
 
-	def save_images(self, filepath):
 		# make sure directory for images exists
 		filepath = path.join(filepath, Settings.image_folder)
 		if not path.exists(filepath):
 			mkdir(filepath)
 
-		# save figures
 		from image import Image
+		from plot import Plot
+
+		images = {}
+		for child in self._children():
+			if isinstance(child, Image):
+				image = child
+			elif isinstance(child, Plot) and child._rasterize():
+				image = child.raster()
+			else:
+				continue
+
+			# identical images are stored only once
+			if not path.exists(path.join(filepath, image.filename())):
+				images[image.filename()] = image
+
+		if not images:
+			return None
+
+		threads = min([Settings.image_threads or cpu_count(), len(images)])
+
+		# PIL releases the interpreter lock while encoding
+		pool = ThreadPool(threads)
+		result = Encoding(pool, pool.map_async(lambda image: image.save(filepath), images.values()))
+		pool.close()
+
+		if wait:
+			result.get()
+			return None
+
+		return result
+
+
+	def save_data(self, filepath):
+		"""
+		Writes the data of all plots which are stored in separate files.
+
+		@type  filepath: string
+		@param filepath: directory containing the data folder
+		"""
+
+		from plot import Plot
+
+		# plots sharing a table are saved only once
+		for ax in self._axes():
+			ax.tables()
+
+		plots = {}
+		for child in self._children():
+			if isinstance(child, Plot) and child._data_table():
+				plots[child.filename()] = child
+
+		if not plots:
+			return
+
+		# make sure directory for data tables exists
+		filepath = path.join(filepath, Settings.data_folder)
+		if not path.exists(filepath):
+			mkdir(filepath)
+
+		for plot in plots.values():
+			plot.save(filepath)
+
+
+	def _files(self, children=None):
+		"""
+		Returns the paths of images and data tables used by the LaTeX code of
+		this figure, relative to the location of the LaTeX file.
+
+		@type  children: list/None
+		@param children: only consider these plots (default: all plots)
+
+		@rtype: list
+		@return: list of paths
+		"""
+
+		from image import Image
+		from plot import Plot
+
+		if children is None:
+			children = self._children()
+
+		for ax in self._axes():
+			ax.tables()
+
+		files = []
+
+		for child in children:
+			if isinstance(child, Image):
+				files.append(path.join(Settings.image_folder, child.filename()))
+			elif isinstance(child, Plot):
+				if child._rasterize():
+					files.append(path.join(Settings.image_folder, child.raster().filename()))
+				elif child._data_table():
+					# tables shared by plots are listed once
+					filename = path.join(Settings.data_folder, child.filename())
+					if filename not in files:
+						files.append(filename)
+
+		return files
+
+
+	def _axes(self):
+		"""
+		Iterates over all axes, including axes controlled by an AxesGrid.
+		"""
+
+		from axesgrid import AxesGrid
+		for ax in self.axes:
+			if isinstance(ax, AxesGrid):
+				ax.layout()
+				for key in ax.keys():
+					yield ax[key]
+			else:
+				yield ax
+
+
+	def _children(self):
+		"""
+		Iterates over the plots and other objects of all axes.
+		"""
+
 		from axesgrid import AxesGrid
 		from axes import Axes
 		for ax in self.axes:
 			if isinstance(ax, AxesGrid):
 				for _, axs in ax.grid.iteritems():
 					for child in axs.children:
-						if isinstance(child, Image):
-							child.save(filepath)
+						yield child
 
 			elif isinstance(ax, Axes):
 				for child in ax.children:
-					if isinstance(child, Image):
-						child.save(filepath)
+					yield child
+
+
+
+class Encoding(object):
+	"""
+	Images being encoded by a pool of threads.
+	"""
+
+	# encodings which may not have finished yet
+	_instances = WeakSet()
+
+	def __init__(self, pool, result):
+		self.pool = pool
+		self.result = result
+
+		Encoding._instances.add(self)
+
+
+	@classmethod
+	def running(cls):
+		"""
+		Returns true if any images are still being encoded.
+		"""
+
+		return any(not encoding.result.ready() for encoding in list(cls._instances))
+
+
+	def get(self):
+		"""
+		Waits until all images have been written and the threads have
+		terminated, so that no encoding threads are left running when
+		processes are forked later on (see L{format_coordinates}).
+		"""
+
+		try:
+			self.result.get()
+		finally:
+			self.pool.join()
+			Encoding._instances.discard(self)
@@ -11,9 +11,13 @@ from arrow import Arrow
 from text import Text
 from rectangle import Rectangle
 from circle import Circle
-from numpy import asmatrix, inf, min, copy, arange, repeat, isscalar, sum, ndarray
+from numpy import asmatrix, inf, min, arange, isscalar, sum, ndarray
+from numpy import asarray, atleast_2d, broadcast_to
 from numpy import histogram, append, ceil
 from image import Image
+from batch import compile_all, save_all
+from colormap import register_colormap
+from columns import read_columns
 
 def gcf():
 	"""
@@ -52,6 +56,33 @@ def figure(idx=None, *args, **kwargs):
 	return Figure(idx, *args, **kwargs)
 
 
+def close(fig=None):
+	"""
+	Closes a figure, releasing its plots and images.
+
+	B{Examples:}
+
+		>>> close()       # close the current figure
+		>>> close(2)      # close figure 2
+		>>> close('all')  # close all figures
+
+	@type  fig: Figure/integer/string/None
+	@param fig: a figure, a number identifying a figure or 'all'
+	"""
+
+	if fig is None:
+		figures = [Figure._cf] if Figure._cf else []
+	elif fig == 'all':
+		figures = Figure._figures.values()
+	elif isinstance(fig, Figure):
+		figures = [fig]
+	else:
+		figures = [Figure._figures[fig]] if fig in Figure._figures else []
+
+	for fig in figures:
+		fig.close()
+
+
 def plot(*args, **kwargs):
 	"""
 	Plot lines or markers.
@@ -61,13 +92,16 @@ def plot(*args, **kwargs):
 		>>> plot(y)           # plot y using values 1 to len(y) for x
 		>>> plot(x, y)        # plot x and y using default line style and color
 		>>> plot(x, y, 'r.')  # plot red markers at positions x and y
+		>>> plot(x, y, copy=False)  # refer to x and y instead of copying them
+		>>> plot(data='metrics.npz', x='time', y='loss')  # plot columns of a table
+		>>> plot(data='metrics.csv', x='time', y='loss', yerr='loss_std')
 	"""
 
 	# split formatting information from data points
 	format_string = ''.join([arg for arg in args if isinstance(arg, str)])
-	args = [asmatrix(arg) for arg in args if not isinstance(arg, str)]
+	args = [atleast_2d(asarray(arg)) for arg in args if not isinstance(arg, str)]
 
-	if not len(args):
+	if not len(args) and kwargs.get('data', None) is None:
 		# no data is given, don't create a plot
 		return None
 
@@ -129,32 +163,40 @@ def plot(*args, **kwargs):
 		kwargs.pop('yerr')
 
 	if 'xvalues_error' in kwargs:
-		xvalues_error = copy(kwargs['xvalues_error'])
+		xvalues_error = asarray(kwargs['xvalues_error'])
 	if 'yvalues_error' in kwargs:
-		yvalues_error = copy(kwargs['yvalues_error'])
+		yvalues_error = asarray(kwargs['yvalues_error'])
+
+	# how often each row of an argument is used
+	repeats = [1] * len(args)
 
 	if len(args) > 1:
 		# heuristics to use if arguments differ in size
 		if args[0].shape[0] < args[1].shape[0]:
-			args[0] = repeat(args[0], ceil(args[1].shape[0] / float(args[0].shape[0])), 0)
-		if args[0].shape[0] > args[1].shape[0]:
-			args[1] = repeat(args[1], ceil(args[0].shape[0] / float(args[1].shape[0])), 0)
+			repeats[0] = int(ceil(args[1].shape[0] / float(args[0].shape[0])))
+		if args[0].shape[0] * repeats[0] > args[1].shape[0]:
+			repeats[1] = int(ceil(args[0].shape[0] * repeats[0] / float(args[1].shape[0])))
 
+		# views instead of repeated copies of single columns
 		if args[0].shape[1] == 1:
-			args[0] = repeat(args[0], args[1].shape[1], 1)
+			args[0] = broadcast_to(args[0], [args[0].shape[0], args[1].shape[1]])
 		if args[1].shape[1] == 1:
-			args[1] = repeat(args[1], args[0].shape[1], 1)
+			args[1] = broadcast_to(args[1], [args[1].shape[0], args[0].shape[1]])
 
 	# if arguments contain multiple rows, create multiple plots
-	if len(args) and args[0].shape[0] > 1:
+	if len(args) and args[0].shape[0] * repeats[0] > 1:
 		plots = []
 
-		for i in range(len(args[0])):
+		for i in range(args[0].shape[0] * repeats[0]):
 			if 'yvalues_error' in kwargs and yvalues_error.shape[0] > 1:
 				kwargs['yvalues_error'] = yvalues_error[i]
 			if 'xvalues_error' in kwargs and xvalues_error.shape[0] > 1:
 				kwargs['xvalues_error'] = xvalues_error[i]
-			plots.append(plot(*[arg[i] for arg in args], **kwargs))
+			plots.append(plot(*[arg[i // r] for arg, r in zip(args, repeats)], **kwargs))
+
+			if len(args) < 2 or args[0].shape[0] == 1:
+				# plots refer to the same x-values, so that they share a table
+				plots[-1].xvalues = plots[0].xvalues
 
 		return plots
 
@@ -229,9 +271,10 @@ def hist(values, bins=10, format_string='', range=None, normed=False, density=Fa
 
 	B{Examples:}
 		>>> hist(x, 20, 'k')
+		>>> hist('loss', 20, data='metrics.npz')
 
-	@type  values: array_like
-	@param values: values from which to compute a histogram
+	@type  values: array_like/string
+	@param values: values from which to compute a histogram or a column of C{data}
 
 	@type  bins: int
 	@param bins: number of bins
@@ -252,6 +295,10 @@ def hist(values, bins=10, format_string='', range=None, normed=False, density=Fa
 	@return: a reference to the plot
 	"""
 
+	# read values from a column of a table
+	if kwargs.get('data', None) is not None:
+		values = read_columns(kwargs.pop('data'), [values], kwargs.pop('delimiter', ','))[0]
+
 	# correct arguments if necessary
 	if isinstance(bins, str):
 		if not format_string:
@@ -297,6 +344,7 @@ def errorbar(*args, **kwargs):
 		>>> errorbar(y, y_err, 'r.')
 		>>> errorbar(x, y, y_err)
 		>>> errorbar(x, y, x_err, y_err)
+		>>> errorbar(data='metrics.csv', x='time', y='loss', yerr='loss_std')
 	"""
 
 	# split formatting information from data points
@@ -436,7 +484,7 @@ def axis(*args, **kwargs):
 				gca().zmin, gca().zmax = args[0]
 
 	for key, value in kwargs.items():
-		gca().__dict__[key] = value
+		setattr(gca(), key, value)
 
 	return gca()
 
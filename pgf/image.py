@@ -1,22 +1,82 @@
 from PIL import Image as PILImage
-from numpy import ndarray, array, repeat, min, max, real
-from utils import indent
+from numpy import array, min, max, real, clip, uint8, floor, ceil
+from numpy import memmap, load, arange, add, outer, diff, asarray, ascontiguousarray
+from utils import indent, Tracked
 from axes import Axes
 from settings import Settings
-from os import path
-from colormap import colormaps
+from os import path, rename, getpid
+from hashlib import sha1
+from threading import current_thread
+from colormap import get_colormap
+from png import write_png
 
-class Image(object):
+# bytes of image data processed at once when images are read from memory-mapped files
+chunk_size = 1 << 24
+
+def to_uint8(image, vmin, vmax):
+	"""
+	Rescales floating point values between vmin and vmax to integers between 0
+	and 255. Integer values are only clipped.
+
+	@type  image: ndarray
+	@param image: image or part of an image
+
+	@rtype: ndarray
+	@return: an array of type uint8, which is the given array if it already is
+	"""
+
+	if image.dtype == uint8:
+		return image
+
+	if image.dtype.kind in ['u', 'i']:
+		return clip(image, 0, 255).astype(uint8)
+
+	# copy and rescale image in place
+	image = array(image, dtype=image.dtype if image.dtype.kind == 'f' else float)
+	image -= vmin
+	image *= 256. / (vmax - vmin)
+	clip(image, 0, 255, out=image)
+	return image.astype(uint8)
+
+
+
+def value_range(image):
+	"""
+	Computes minimum and maximum of an array, reading it in chunks.
+
+	@rtype: tuple
+	@return: minimum and maximum value
+	"""
+
+	rows = max([chunk_size // (image[:1].nbytes or 1), 1])
+	values = [(min(image[i:i + rows]), max(image[i:i + rows]))
+		for i in range(0, image.shape[0], rows)]
+	return min([v[0] for v in values]), max([v[1] for v in values])
+
+
+
+class Image(Tracked):
 	"""
-	Represents images.
+	Represents images. Colormapped images are stored as indices into a palette.
+
+	Arrays, PIL images and files are referenced rather than copied. Changes
+	made to them later are only noticed after a call to L{touch}.
 	"""
 
-	_counter = 0
+	# file formats which support palettes
+	_palette_formats = ['PNG', 'GIF', 'BMP', 'TIFF']
 
 	def __init__(self, image, **kwargs):
 		"""
 		@type  image: string/array_like/PIL Image
-		@param image: a filepath or an image in grayscale or RGB
+		@param image: a filepath or an image in grayscale or RGB; memory-mapped
+		arrays, .npy files and raw files (see C{shape}) are read in chunks
+
+		@type  shape: tuple
+		@param shape: shape of the array stored in a raw file
+
+		@type  dtype: string/dtype
+		@param dtype: type of values stored in a raw file (default: uint8)
 
 		@param vmin:
 
@@ -30,67 +90,391 @@ class Image(object):
 		@param ymax:
 
 		@param limits:
+
+		@type  pgf_options: list
+		@param pgf_options: custom PGFPlots plot options
+
+		@type  attach: boolean
+		@param attach: if false, the image is not added to the children of the axes
+
+		@type  crop: boolean
+		@param crop: only store the part of the image visible within the axes limits
+
+		@type  dpi: float/None
+		@param dpi: downsample stored image to this resolution (default: L{Settings.image_dpi})
+
+		@type  image_format: string/None
+		@param image_format: file format, e.g. 'PNG' or 'JPEG' (default: L{Settings.image_format})
+
+		@type  image_options: dict
+		@param image_options: options passed to PIL when saving, overriding L{Settings.image_options}
 		"""
 
 		self._cmap = kwargs.get('cmap', 'gray')
 
-		if isinstance(image, str):
-			self.image = PILImage.open(image)
+		# range of values represented by the image
+		self.vmin = kwargs.get('vmin', 0.)
+		self.vmax = kwargs.get('vmax', 1.)
 
-		elif isinstance(image, PILImage.Image):
-			self.image = image.copy()
+		# source of the image; only one of them is set
+		self.data = None
+		self._path = None
+		self._pil = None
 
-		else:
-			if isinstance(image, ndarray):
-				# copy array
-				image = array(image)
+		# data which is read from a file as needed
+		self._mapped = False
 
-				if image.dtype.kind not in ['u', 'i']:
-					self.vmin = kwargs.get('vmin', min(image))
-					self.vmax = kwargs.get('vmax', max(image))
+		if isinstance(image, str):
+			if path.splitext(image)[1].lower() == '.npy':
+				image = load(image, mmap_mode='r')
+			elif 'shape' in kwargs:
+				# raw data
+				image = memmap(image, dtype=kwargs.get('dtype', uint8), mode='r', shape=kwargs['shape'])
 
-					# rescale image
-					image = (image - self.vmin) / (self.vmax - self.vmin)
-					image = array(image * 256., dtype='int32')
+		if isinstance(image, str):
+			# image is loaded when needed
+			self._path = image
 
-				image[image < 0] = 0
-				image[image > 255] = 255
-				image = array(image, dtype='uint8')
+		elif isinstance(image, PILImage.Image):
+			self._pil = image
 
-				if image.ndim < 3:
-					image = repeat(image.reshape(image.shape[0], -1, 1), 3, 2)
-					for i in range(image.shape[0]):
-						for j in range(image.shape[1]):
-							image[i, j, :] = colormaps[self._cmap][image[i, j, 0]]
+		else:
+			# arrays are referenced, not copied
+			self.data = asarray(image)
+			self._mapped = isinstance(image, memmap)
 
-			self.image = PILImage.fromarray(image)
+			if self.data.dtype.kind not in ['u', 'i']:
+				vmin, vmax = (None, None) if 'vmin' in kwargs and 'vmax' in kwargs \
+					else value_range(self.data)
+				self.vmin = kwargs.get('vmin', vmin)
+				self.vmax = kwargs.get('vmax', vmax)
+
+		width, height = self._size()
 
 		# specify pixel coordinates 
 		self.xmin = kwargs.get('xmin', 0)
-		self.xmax = kwargs.get('xmax', self.image.size[0])
+		self.xmax = kwargs.get('xmax', width)
 		self.ymin = kwargs.get('ymin', 0)
-		self.ymax = kwargs.get('ymax', self.image.size[1])
+		self.ymax = kwargs.get('ymax', height)
 
 		if 'limits' in kwargs:
 			self.xmin, self.xmax, \
 			self.ymin, self.ymax = kwargs['limits']
 
+		# how the image is stored
+		self.crop = kwargs.get('crop', True)
+		self.dpi = kwargs.get('dpi', None)
+		self.image_format = kwargs.get('image_format', None)
+		self.image_options = kwargs.get('image_options', {})
+
+		# custom plot options
+		self.pgf_options = kwargs.get('pgf_options', [])
+
+		# catch common mistakes
+		if not isinstance(self.pgf_options, list):
+			raise TypeError('pgf_options should be a list.')
+
 		# add image to axis
 		self.axes = kwargs.get('axes', Axes.gca())
-		self.axes.children.append(self)
+		if kwargs.get('attach', True):
+			self.axes.children.append(self)
+
+		self._digest = None
+
+
+	@property
+	def image(self):
+		"""
+		The image as a PIL image. Images given as arrays or filepaths are
+		converted when needed and released after they have been saved.
+		"""
 
-		self.idx = Image._counter
-		Image._counter += 1
+		if self._pil is None:
+			if self.data is not None:
+				self._pil = self._to_pil(self.data)
+			else:
+				self._pil = PILImage.open(self._path)
+		return self._pil
+
+
+	@image.setter
+	def image(self, image):
+		self.data = None
+		self._mapped = False
+		self._path = None
+		self._pil = image
+
+
+	def release(self):
+		"""
+		Drops pixel data derived from the source of the image. It is computed
+		again if the image needs to be saved once more.
+		"""
+
+		if self.data is not None or self._path is not None:
+			self._pil = None
 
 
 	def filename(self):
-		return \
-			str(self.axes.figure._session) + '_' + \
-			str(self.idx) + '.' + Settings.image_format.lower()
+		"""
+		Returns a filename derived from the pixels of the image and how it is
+		stored, so that identical images are stored only once and keep their
+		name across runs.
+
+		@rtype: string
+		@return: name of the image file
+		"""
+
+		image_format, options = self._encoding()
+
+		if self._digest is None or self._digest[0] != self._version:
+			digest = sha1()
+			if self.data is not None:
+				# values are mapped to colors when the image is saved
+				digest.update('{0}:{1}:{2}:{3}:'.format(self.data.dtype, self.data.shape, self.vmin, self.vmax))
+				if self.data.ndim < 3:
+					digest.update(get_colormap(self._cmap).lut.tobytes())
+				for i in range(0, self.data.shape[0], self._chunk_rows()):
+					digest.update(self.data[i:i + self._chunk_rows()].tobytes())
+			else:
+				digest.update('{0}:{1}:'.format(self.image.mode, self.image.size))
+				if self.image.mode == 'P':
+					digest.update(str(self.image.getpalette()))
+				digest.update(self.image.tobytes())
+				self.release()
+			self._digest = (self._version, digest.hexdigest())
+
+		box, _, size = self._viewport()
+
+		digest = sha1('{0}:{1}:{2}:{3}:{4}'.format(self._digest[1], box, size, image_format, options))
+
+		return digest.hexdigest()[:20] + '.' + image_format.lower()
 
 
 	def save(self, filepath=''):
-		self.image.save(path.join(filepath, self.filename()))
+		"""
+		Saves the image unless a file with the same content already exists.
+
+		@type  filepath: string
+		@param filepath: directory in which the image is stored
+		"""
+
+		filename = path.join(filepath, self.filename())
+
+		if path.exists(filename):
+			return
+
+		image_format, options = self._encoding()
+		box, _, size = self._viewport()
+
+		# write to temporary file first, so that incomplete files are never reused
+		tmp_file = '{0}.{1}.{2}.tmp'.format(filename, getpid(), current_thread().ident)
+
+		if self._mapped and image_format.upper() == 'PNG' and set(dict(options)) <= set(['compress_level']):
+			# compute and compress the image in chunks of rows; other options,
+			# e.g. optimize, and in-memory images are handled by PIL
+			if self.data.ndim < 3 and size == (box[2] - box[0], box[3] - box[1]):
+				mode, palette = 'P', get_colormap(self._cmap).lut
+			else:
+				mode, palette = 'RGB' if self.data.ndim < 3 or self.data.shape[2] == 3 else 'RGBA', None
+
+			write_png(tmp_file, self._rows(box, size), size, mode, palette,
+				dict(options).get('compress_level', 6))
+			rename(tmp_file, filename)
+
+			self.release()
+			return
+
+		# other file formats require the whole image
+		image = self.image
+
+		if box != (0, 0) + image.size:
+			image = image.crop(box)
+
+		if image.mode == 'P' and (size != image.size or image_format.upper() not in self._palette_formats):
+			# expand indices to colors
+			image = image.convert('RGB')
+
+		if size != image.size:
+			# average over pixels
+			image = image.resize(size, PILImage.BOX)
+
+		image.save(tmp_file, image_format, **dict(options))
+		rename(tmp_file, filename)
+
+		self.release()
+
+
+	def _rows(self, box, size):
+		"""
+		Maps values to colors and downsamples the image one chunk of rows at a
+		time. Colormapped images which are not downsampled are returned as
+		palette indices.
+
+		@type  box: tuple
+		@param box: pixels to be stored (left, upper, right, lower)
+
+		@type  size: tuple
+		@param size: number of pixels stored
+
+		@rtype: generator
+		@return: blocks of rows of type uint8
+		"""
+
+		left, upper, right, lower = box
+		width, height = right - left, lower - upper
+		chunk_rows = self._chunk_rows()
+
+		if size == (width, height):
+			for i in range(upper, lower, chunk_rows):
+				yield to_uint8(self.data[i:min([i + chunk_rows, lower]), left:right], self.vmin, self.vmax)
+			return
+
+		# source pixels averaged for each stored row and column
+		row_bounds = upper + arange(size[1] + 1) * height // size[1]
+		col_bounds = arange(size[0] + 1) * width // size[0]
+
+		# stored rows per chunk
+		step = max([chunk_rows * size[1] // height, 1])
+
+		for j in range(0, size[1], step):
+			bounds = row_bounds[j:j + step + 1]
+
+			block = to_uint8(self.data[bounds[0]:bounds[-1], left:right], self.vmin, self.vmax)
+			if block.ndim < 3:
+				block = get_colormap(self._cmap).lut[block]
+
+			# average over pixels
+			block = add.reduceat(block, col_bounds[:-1], axis=1, dtype=float)
+			block = add.reduceat(block, bounds[:-1] - bounds[0], axis=0)
+			block /= outer(diff(bounds), diff(col_bounds))[:, :, None]
+			block += 0.5
+
+			yield block.astype(uint8)
+
+
+	def _chunk_rows(self):
+		"""
+		Number of rows processed at once by L{_rows}.
+		"""
+
+		return max([chunk_size // (self.data[:1].nbytes or 1), 1])
+
+
+	def _to_pil(self, image):
+		"""
+		Turns an array into a PIL image. Values of 2D arrays are mapped to
+		colors via a palette.
+		"""
+
+		image = to_uint8(image, self.vmin, self.vmax)
+
+		if image.ndim < 3 or image.shape[2] in [3, 4]:
+			# share memory with the array
+			mode = 'L' if image.ndim < 3 else ['RGB', 'RGBA'][image.shape[2] - 3]
+			pil_image = PILImage.frombuffer(mode, (image.shape[1], image.shape[0]),
+				ascontiguousarray(image), 'raw', mode, 0, 1)
+		else:
+			pil_image = PILImage.fromarray(image)
+
+		if image.ndim < 3:
+			# map values to colors via palette
+			pil_image.putpalette(get_colormap(self._cmap).lut.ravel().tolist())
+
+		return pil_image
+
+
+	def _size(self):
+		"""
+		Returns width and height of the image in pixels.
+		"""
+
+		if self.data is not None:
+			return self.data.shape[1], self.data.shape[0]
+		if self._pil is None:
+			# only reads the header of the file
+			return PILImage.open(self._path).size
+		return self._pil.size
+
+
+	def _viewport(self):
+		"""
+		Determines which pixels are visible within the axes limits and how many
+		pixels are needed to display them at the targeted resolution.
+
+		@rtype: tuple
+		@return: pixel box (left, upper, right, lower), its limits and the stored size
+		"""
+
+		width, height = self._size()
+		xmin, xmax, ymin, ymax = self.limits()
+
+		box = (0, 0, width, height)
+		limits = [xmin, xmax, ymin, ymax]
+
+		if self.axes.axes_type != 'axis' or not (xmin < xmax and ymin < ymax):
+			# only linear axes and images with increasing limits are supported
+			return box, limits, (width, height)
+
+		# limits of the axes
+		view = [self.axes.xmin, self.axes.xmax, self.axes.ymin, self.axes.ymax]
+		if None in view:
+			view = [a if a is not None else b for a, b in zip(view, self.axes.limits())]
+
+		if not (view[0] < view[1] and view[2] < view[3]):
+			return box, limits, (width, height)
+
+		if self.crop:
+			# pixels covering the visible part of the image (the first row is at the top)
+			scale_x = width / float(xmax - xmin)
+			scale_y = height / float(ymax - ymin)
+			left = int(floor((max([view[0], xmin]) - xmin) * scale_x))
+			right = int(ceil((min([view[1], xmax]) - xmin) * scale_x))
+			upper = int(floor((ymax - min([view[3], ymax])) * scale_y))
+			lower = int(ceil((ymax - max([view[2], ymin])) * scale_y))
+
+			# keep at least one pixel
+			left = min([max([left, 0]), width - 1])
+			upper = min([max([upper, 0]), height - 1])
+			right = min([max([right, left + 1]), width])
+			lower = min([max([lower, upper + 1]), height])
+
+			if (left, upper, right, lower) != box:
+				box = (left, upper, right, lower)
+				limits = [
+					xmin + left / scale_x,
+					xmin + right / scale_x,
+					ymax - lower / scale_y,
+					ymax - upper / scale_y]
+
+		size = (box[2] - box[0], box[3] - box[1])
+
+		dpi = self.dpi or Settings.image_dpi
+
+		if dpi:
+			# number of pixels which can be displayed
+			size = (
+				min([size[0], int(ceil(self.axes.width / 2.54 * dpi
+					* (limits[1] - limits[0]) / (view[1] - view[0])))]),
+				min([size[1], int(ceil(self.axes.height / 2.54 * dpi
+					* (limits[3] - limits[2]) / (view[3] - view[2])))]))
+			size = (max([size[0], 1]), max([size[1], 1]))
+
+		return box, limits, size
+
+
+	def _encoding(self):
+		"""
+		Returns the file format and the options used to save the image.
+
+		@rtype: tuple
+		@return: file format and sorted list of options
+		"""
+
+		options = dict(Settings.image_options)
+		options.update(self.image_options)
+
+		return self.image_format or Settings.image_format, sorted(options.items())
 
 
 	def render(self):
@@ -101,8 +485,13 @@ class Image(object):
 		@return: LaTeX code for this plot
 		"""
 
-		tex = '\\addplot[point meta min={0:5f}, point meta max={1:5f}] graphics\n'.format(self.vmin, self.vmax)
-		tex += indent('[xmin={0},xmax={1},ymin={2},ymax={3}]\n'.format(*self.limits()))
+		options = [
+			'point meta min={0:5f}'.format(self.vmin),
+			'point meta max={0:5f}'.format(self.vmax)]
+		options.extend(self.pgf_options)
+
+		tex = '\\addplot[{0}] graphics\n'.format(', '.join(options))
+		tex += indent('[xmin={0},xmax={1},ymin={2},ymax={3}]\n'.format(*self._viewport()[1]))
 		tex += indent('{' + path.join(Settings.image_folder, self.filename()) + '};\n')
 
 		return tex
@@ -116,8 +505,8 @@ class Image(object):
 
 
 	def  width(self):
-		return self.image.size[0]
+		return self._size()[0]
 
 
 	def  height(self):
-		return self.image.size[1]
+		return self._size()[1]
@@ -1,11 +1,43 @@
-from numpy import asarray, arange, min, max, shape, zeros
+from numpy import asarray, arange, min, max, shape, zeros, log10, ceil, errstate
 from axes import Axes
 from string import replace
 from re import match
 from rgb import RGB
-from utils import indent
+from utils import indent, render_string, hash_values, Tracked
+from coordinates import format_coordinates, write_coordinates
+from downsample import m4, lttb
+from raster import count_marks, render_marks, render_density, color_to_rgb, parse_color
+from raster import cycle_colors
+from coordinates import format_value
+from columns import is_csv, read_columns, CSVTable
+from settings import Settings
+from os import path, link, stat, rename, getpid
+from shutil import copyfile
+from hashlib import sha1
+from threading import current_thread
+
+def vector(values, copy=True):
+	"""
+	Turns values into a one-dimensional array.
+
+	@type  values: array_like
+	@param values: data points
+
+	@type  copy: boolean
+	@param copy: if false, arrays are only reshaped, which avoids a copy
+	whenever possible
+
+	@rtype: ndarray
+	@return: a one-dimensional array
+	"""
+
+	if copy:
+		return asarray(values).flatten()
+	return asarray(values).reshape(-1)
 
-class Plot(object):
+
+
+class Plot(Tracked):
 	"""
 	Represents line plots.
 
@@ -90,25 +122,103 @@ class Plot(object):
 	@type pgf_options: list
 	@ivar pgf_options: custom PGFPlots plot options
 
+	@type data_table: boolean/None
+	@ivar data_table: store data points in a separate file (default: L{Axes.data_tables})
+
+	@type group: object/None
+	@ivar group: plots of the same group with equal x-values share a table of data points
+
+	@type downsample: string/None
+	@ivar downsample: reduce data points of line plots with 'm4' or 'lttb'
+
+	@type dpi: float/None
+	@ivar dpi: resolution used for downsampling and rasterization (default: L{Settings.dpi})
+
+	@type rasterize: boolean/string/None
+	@ivar rasterize: render marks into an image; True, False or 'auto' (default: L{Settings.rasterize})
+
+	@type density: boolean/string
+	@ivar density: color rasterized marks by density; True or the name of a colormap
+
 	@type comment: string
 	@ivar comment: can be used to put a comment into the LaTeX code
 	"""
 
+	_counter = 0
+
+	# attributes which can be read from columns of a table
+	_column_attributes = ['xvalues', 'yvalues', 'xvalues_error', 'yvalues_error']
+
 	def __init__(self, *args, **kwargs):
 		"""
-		Initializes plot properties.
+		Initializes plot properties. Data points are copied unless C{copy} is
+		false, in which case the plot refers to the given arrays (keeping their
+		type) and changes made to them later require a call to L{touch}.
+
+		Instead of arrays, C{data} can be a structured array, a mapping of
+		arrays or the path to a .npy, .npz or CSV file, and C{x}, C{y},
+		C{xvalues_error} and C{yvalues_error} name its columns. Columns are not
+		copied unless C{copy} is true. CSV files (whose columns are separated
+		by C{delimiter}) are only parsed if their values are needed, e.g. for
+		downsampling or rasterization; otherwise PGFPlots reads the file as it
+		is.
 		"""
 
+		# CSV file read by PGFPlots and columns which have not been parsed yet
+		self._table = None
+		self._pending = []
+
+		# table shared with plots having the same x-values
+		self._shared = None
+
+		# hash of the data points and the version it was computed for
+		self._digest = None
+
+		# columns of a table
+		data = kwargs.get('data', None)
+		columns = {}
+
+		if data is not None:
+			for name, key in zip(Plot._column_attributes, ['x', 'y', 'xvalues_error', 'yvalues_error']):
+				if kwargs.get(key, None) is not None:
+					columns[name] = kwargs[key]
+
+			if 'yvalues' not in columns:
+				raise ValueError('No column of y-values given.')
+
+		# copy data points or refer to the caller's arrays
+		copy = kwargs.get('copy', data is None)
+
 		# data points
-		if len(args) < 1:
+		if data is not None and is_csv(data):
+			# values of CSV files are parsed on first access
+			self._pending = [name for name in Plot._column_attributes
+				if name in columns or name == 'xvalues']
+			if 'xvalues_error' not in columns:
+				self.xvalues_error = asarray([])
+			if 'yvalues_error' not in columns:
+				self.yvalues_error = asarray([])
+			self._table = CSVTable(data, kwargs.get('delimiter', ','))
+			self._table_columns = columns
+		elif data is not None:
+			names = sorted(columns)
+			values = read_columns(data, [columns[name] for name in names])
+			for name in Plot._column_attributes:
+				if name in columns:
+					setattr(self, name, vector(values[names.index(name)], copy))
+				else:
+					setattr(self, name, asarray([]))
+			if 'xvalues' not in columns:
+				self.xvalues = arange(1, len(self.yvalues) + 1)
+		elif len(args) < 1:
 			self.xvalues = asarray([])
 			self.yvalues = asarray([])
 		elif len(args) < 2:
-			self.yvalues = asarray(args[0]).flatten()
+			self.yvalues = vector(args[0], copy)
 			self.xvalues = arange(1, len(self.yvalues) + 1)
 		else:
-			self.xvalues = asarray(args[0]).flatten()
-			self.yvalues = asarray(args[1]).flatten()
+			self.xvalues = vector(args[0], copy)
+			self.yvalues = vector(args[1], copy)
 
 		# labels for each data point
 		self.labels = kwargs.get('labels', None)
@@ -135,8 +245,9 @@ class Plot(object):
 		self.marker_opacity = kwargs.get('marker_opacity', None)
 
 		# error bars
-		self.xvalues_error = asarray(kwargs.get('xvalues_error', [])).flatten()
-		self.yvalues_error = asarray(kwargs.get('yvalues_error', [])).flatten()
+		if data is None:
+			self.xvalues_error = vector(kwargs.get('xvalues_error', []), copy)
+			self.yvalues_error = vector(kwargs.get('yvalues_error', []), copy)
 		self.error_marker = kwargs.get('error_marker', None)
 		self.error_color = kwargs.get('error_color', None)
 		self.error_style = kwargs.get('error_style', None)
@@ -163,6 +274,29 @@ class Plot(object):
 		if not isinstance(self.pgf_options, list):
 			raise TypeError('pgf_options should be a list.')
 
+		# store data points in a separate file
+		self.data_table = kwargs.get('data_table', None)
+
+		# share a table of data points with other plots having the same x-values
+		self.group = kwargs.get('group', None)
+
+		# reduce number of data points to what can be displayed
+		self.downsample = kwargs.get('downsample', None)
+		self.dpi = kwargs.get('dpi', None)
+
+		if self.downsample not in [None, False, 'm4', 'lttb']:
+			raise ValueError('Unknown downsampling method \'{0}\'.'.format(self.downsample))
+
+		# kept data points and the state they were computed for
+		self._indices_value = None
+		self._indices_key = None
+
+		# render marks into an image
+		self.rasterize = kwargs.get('rasterize', None)
+		self.density = kwargs.get('density', False)
+		self._raster = None
+		self._raster_key = None
+
 		# comment LaTeX code
 		self.comment = kwargs.get('comment', '')
 
@@ -170,6 +304,24 @@ class Plot(object):
 		self.axes = kwargs.get('axes', Axes.gca())
 		self.axes.children.append(self)
 
+		self.idx = Plot._counter
+		Plot._counter += 1
+
+
+	def __getattr__(self, name):
+		if name in self.__dict__.get('_pending', []):
+			self._load()
+			return self.__dict__[name]
+		raise AttributeError(name)
+
+
+	def __setattr__(self, name, value):
+		if name in Plot._column_attributes and self.__dict__.get('_table') is not None:
+			# values no longer correspond to the CSV file
+			self._load()
+			self._table = None
+		Tracked.__setattr__(self, name, value)
+
 
 	def render(self):
 		"""
@@ -179,6 +331,17 @@ class Plot(object):
 		@return: LaTeX code for this plot
 		"""
 
+		return render_string(self)
+
+
+	def render_to(self, writer):
+		"""
+		Writes LaTeX code for this plot.
+
+		@type  writer: L{Writer}
+		@param writer: keeps track of the output stream and indentation
+		"""
+
 		options = []
 		marker_options = []
 		error_options = []
@@ -234,13 +397,16 @@ class Plot(object):
 		if self.pattern:
 			options.append('pattern={{{0}}}'.format(self.pattern))
 
-		# error bar properties
-		if len(self.xvalues_error) or len(self.yvalues_error):
+		# error bar properties (known without parsing CSV files)
+		x_error = 'xvalues_error' in self._pending or len(self.xvalues_error) > 0
+		y_error = 'yvalues_error' in self._pending or len(self.yvalues_error) > 0
+
+		if x_error or y_error:
 			options.append('error bars/.cd')
-		if len(self.xvalues_error):
+		if x_error:
 			options.append('x dir=both')
 			options.append('x explicit')
-		if len(self.yvalues_error):
+		if y_error:
 			options.append('y dir=both')
 			options.append('y explicit')
 		if self.error_marker:
@@ -273,11 +439,184 @@ class Plot(object):
 		if len(options_string) > 70:
 			options_string = '\n' + indent(',\n'.join(options))
 
-		tex = '% ' + self.comment + '\n' if self.comment else ''
+		if self.comment:
+			writer.write('% ' + self.comment + '\n')
+
+		if self._rasterize():
+			# marks are shown as an image
+			writer.write(self.raster().render())
+
+			# an invisible mark takes this plot's place in the cycle list and legend
+			xdigits, ydigits, _ = self.axes.digits()
+			options.append('opacity=0')
+			options.append('legend image post style={{opacity={0}}}'.format(
+				self.opacity if self.opacity is not None else 1))
+
+			writer.write('\\addplot+[{0}] coordinates {{({1}, {2})}};\n'.format(
+				', '.join(options),
+				format_value(self.xvalues[0], xdigits),
+				format_value(self.yvalues[0], ydigits)))
+
+			if self.legend_entry is not None:
+				writer.write('\\addlegendentry{{{0}}};\n'.format(
+					self.legend_entry.replace('_', '\\_')))
+			return
+
 		if options_string:
-			tex += '\\addplot+[{0}] coordinates {{\n'.format(options_string)
+			writer.write('\\addplot+[{0}] '.format(options_string))
 		else:
-			tex += '\\addplot coordinates {\n'
+			writer.write('\\addplot ')
+
+		if self._shared is not None:
+			# read y-values from a column of a table shared with other plots
+			table_options = ['x=x', 'y={0}'.format(self._shared.column(self))]
+			if self._shared.data_table():
+				table_options.append('col sep=tab')
+
+			writer.write('table[{0}] {{{1}}}'.format(
+				', '.join(table_options), self._shared.source()))
+
+		elif self._passthrough():
+			# PGFPlots reads the CSV file as it is
+			columns = self._table_columns
+
+			if 'xvalues' in columns:
+				table_options = [self._table.option('x', columns['xvalues'])]
+			else:
+				table_options = ['x expr=\\coordindex+1']
+			table_options.append(self._table.option('y', columns['yvalues']))
+			if 'xvalues_error' in columns:
+				table_options.append(self._table.option('x error', columns['xvalues_error']))
+			if 'yvalues_error' in columns:
+				table_options.append(self._table.option('y error', columns['yvalues_error']))
+			table_options.extend(self._table.options())
+
+			writer.write('table[{0}] {{{1}}}'.format(
+				', '.join(table_options),
+				path.join(Settings.data_folder, self.filename())))
+
+		elif self._data_table():
+			names, columns, precision = self._columns()
+
+			# read data points from file
+			table_options = ['x=x', 'y=y']
+			if 'xerr' in names:
+				table_options.append('x error=xerr')
+				table_options.append('y error=yerr')
+			if 'label' in names:
+				table_options.append('meta=label')
+			table_options.append('col sep=tab')
+
+			writer.write('table[{0}] {{{1}}}'.format(
+				', '.join(table_options),
+				path.join(Settings.data_folder, self.filename())))
+		else:
+			names, columns, precision = self._columns()
+
+			writer.write('coordinates {\n')
+
+			if 'xerr' in names:
+				# render plot with error bars
+				write_coordinates(writer, columns, '\t({0}, {1}) +- ({2}, {3})\n', precision)
+			elif 'label' in names:
+				# render labeled plot coordinates
+				write_coordinates(writer, columns, '\t({0}, {1}) [{2}]\n', precision)
+			else:
+				# render plot coordinates
+				write_coordinates(writer, columns, '\t({0}, {1})\n', precision)
+
+			writer.write('}')
+
+		if self.closed:
+			writer.write(' \\closedcycle;\n')
+		else:
+			writer.write(';\n')
+
+		if self.legend_entry is not None:
+			writer.write('\\addlegendentry{{{0}}};\n'.format(
+				self.legend_entry.replace('_', '\\_')))
+
+
+	def filename(self):
+		"""
+		Returns the name of the file storing the data points. Data tables are
+		named after their content and formatting, so that identical tables are
+		stored only once and are reused by other figures and across runs.
+
+		@rtype: string
+		@return: name of the data file
+		"""
+
+		if self._shared is not None:
+			return self._shared.filename()
+
+		if self._passthrough():
+			# CSV files are named after their location and modification
+			info = stat(self._table.filename)
+			digest = sha1('{0}:{1}:{2}'.format(
+				path.abspath(self._table.filename), info.st_mtime, info.st_size))
+			return digest.hexdigest()[:20] + '.csv'
+
+		indices = self._indices()
+
+		digest = sha1('{0}:{1}:'.format(self._data_digest(), self.axes.digits()[:2]))
+		if indices is not None:
+			hash_values(digest, indices)
+
+		return digest.hexdigest()[:20] + '.dat'
+
+
+	def save(self, filepath=''):
+		"""
+		Writes the data points of this plot into a tab-separated table, unless
+		a table with the same content already exists.
+
+		@type  filepath: string
+		@param filepath: directory in which the table will be stored
+		"""
+
+		if self._shared is not None:
+			self._shared.save(filepath)
+			return
+
+		filename = path.join(filepath, self.filename())
+
+		if path.exists(filename):
+			return
+
+		# write to temporary file first, so that incomplete files are never reused
+		tmp_file = '{0}.{1}.{2}.tmp'.format(filename, getpid(), current_thread().ident)
+
+		if self._passthrough():
+			# link or copy CSV file
+			try:
+				link(self._table.filename, tmp_file)
+			except OSError:
+				copyfile(self._table.filename, tmp_file)
+			rename(tmp_file, filename)
+			return
+
+		names, columns, precision = self._columns()
+		template = '\t'.join(['{}'] * len(names)) + '\n'
+
+		with open(tmp_file, 'w') as handle:
+			handle.write('\t'.join(names) + '\n')
+			for chunk in format_coordinates(columns, template, precision=precision):
+				handle.write(chunk)
+
+		rename(tmp_file, filename)
+
+
+	def _columns(self):
+		"""
+		Returns names, values and significant digits of the data columns of
+		this plot.
+
+		@rtype: tuple
+		@return: lists of column names, columns and digits
+		"""
+
+		xdigits, ydigits, _ = self.axes.digits()
 
 		if len(self.xvalues_error) or len(self.yvalues_error):
 			x_error = self.xvalues_error if len(self.xvalues_error) \
@@ -285,27 +624,280 @@ class Plot(object):
 			y_error = self.yvalues_error if len(self.yvalues_error) \
 				else zeros(shape(self.xvalues_error))
 
-			# render plot with error bars
-			for x, y, e, f in zip(self.xvalues, self.yvalues, x_error, y_error):
-				tex += '\t({0}, {1}) +- ({2}, {3})\n'.format(x, y, e, f)
+			names = ['x', 'y', 'xerr', 'yerr']
+			columns = [self.xvalues, self.yvalues, x_error, y_error]
+			digits = [xdigits, ydigits, xdigits, ydigits]
+
+		elif self.labels:
+			names = ['x', 'y', 'label']
+			columns = [self.xvalues, self.yvalues, list(self.labels)]
+			digits = [xdigits, ydigits, None]
+
 		else:
-			# render plot coordinates
+			names = ['x', 'y']
+			columns = [self.xvalues, self.yvalues]
+			digits = [xdigits, ydigits]
+
+		indices = self._indices()
+
+		if indices is not None:
+			# only keep selected data points
+			columns = [[column[i] for i in indices] if isinstance(column, list)
+				else asarray(column)[indices] for column in columns]
+
+		return names, columns, digits
+
+
+	def _data_digest(self):
+		"""
+		Returns a hash of the data points, which is computed again only after
+		the plot changed.
+
+		@rtype: string
+		@return: hexadecimal digest
+		"""
+
+		if self._digest is None or self._digest[0] != self._version:
+			digest = sha1()
+			for values in [self.xvalues, self.yvalues, self.xvalues_error, self.yvalues_error]:
+				hash_values(digest, values)
 			if self.labels:
-				for x, y, l in zip(self.xvalues, self.yvalues, self.labels):
-					tex += '\t({0}, {1}) [{2}]\n'.format(x, y, l)
+				hash_values(digest, list(self.labels))
+			self._digest = (self._version, digest.hexdigest())
+
+		return self._digest[1]
+
+
+	def _indices(self):
+		"""
+		Returns the indices of data points kept after downsampling. The number
+		of pixel columns is computed from the width of the axes and the visible
+		x-range at the time of rendering. The indices are reused as long as the
+		plot, the visible x-range and the resolution do not change.
+
+		@rtype: ndarray/None
+		@return: sorted indices or None if all data points are kept
+		"""
+
+		if not self.downsample or len(self.xvalues) < 3:
+			return None
+
+		# visible x-range
+		xmin, xmax = self.axes.xmin, self.axes.xmax
+		if xmin is None or xmax is None:
+			limits = self.axes.limits()
+			xmin = limits[0] if xmin is None else xmin
+			xmax = limits[1] if xmax is None else xmax
+
+		num_columns = int(ceil(self.axes.width / 2.54 * (self.dpi or Settings.dpi)))
+
+		key = (self._version, xmin, xmax, self.axes.axes_type, num_columns)
+
+		if self._indices_key != key:
+			self._indices_value = self._downsample(xmin, xmax, num_columns)
+			self._indices_key = key
+
+		return self._indices_value
+
+
+	def _downsample(self, xmin, xmax, num_columns):
+		"""
+		Returns the indices of data points kept after downsampling.
+		"""
+
+		xvalues = asarray(self.xvalues, dtype=float)
+
+		if self.axes.axes_type in ['semilogxaxis', 'loglogaxis']:
+			if xmin <= 0.:
+				return None
+
+			# pixel columns are evenly spaced in log-space
+			xmin, xmax = log10(xmin), log10(xmax)
+			with errstate(divide='ignore', invalid='ignore'):
+				xvalues = log10(xvalues)
+
+		if self.downsample == 'm4':
+			return m4(xvalues, self.yvalues, xmin, xmax, num_columns)
+		return lttb(xvalues, self.yvalues, xmin, xmax, num_columns)
+
+
+	def raster(self):
+		"""
+		Renders the marks of this plot into an image covering the visible area
+		of the axes. The image is reused as long as the axes limits and size do
+		not change.
+
+		@rtype: L{Image}
+		@return: image of the marks
+		"""
+
+		from image import Image
+
+		# visible area
+		limits = [self.axes.xmin, self.axes.xmax, self.axes.ymin, self.axes.ymax]
+		if None in limits:
+			limits = [a if a is not None else b for a, b in zip(limits, self.axes.limits())]
+		for i in [0, 2]:
+			if not limits[i + 1] > limits[i]:
+				limits[i], limits[i + 1] = limits[i] - 0.5, limits[i] + 0.5
+
+		dpi = self.dpi or Settings.dpi
+		shape = (
+			int(ceil(self.axes.height / 2.54 * dpi)),
+			int(ceil(self.axes.width / 2.54 * dpi)))
+		log_scale = (
+			self.axes.axes_type in ['semilogxaxis', 'loglogaxis'],
+			self.axes.axes_type in ['semilogyaxis', 'loglogaxis'])
+
+		# PGFPlots' default mark size is 2pt
+		radius = 2. * (self.marker_size if self.marker_size is not None else 1.) / 72.27 * dpi
+
+		opacity = self.marker_opacity if self.marker_opacity is not None else self.opacity
+		color = self.marker_face_color or self.color or self._cycle_color()
+
+		key = (tuple(limits), shape, log_scale, radius, opacity, str(color), self.density,
+			self._version)
+
+		if self._raster is None or self._raster_key != key:
+			counts = count_marks(self.xvalues, self.yvalues, limits, shape, radius, log_scale)
+
+			if self.density:
+				image = render_density(counts,
+					self.density if isinstance(self.density, str) else 'jet')
 			else:
-				for x, y in zip(self.xvalues, self.yvalues):
-					tex += '\t({0}, {1})\n'.format(x, y)
-		if self.closed:
-			tex += '} \\closedcycle;\n'
-		else:
-			tex += '};\n'
+				image = render_marks(counts, color_to_rgb(color),
+					opacity if opacity is not None else 1.)
 
-		if self.legend_entry is not None:
-			tex += '\\addlegendentry{{{0}}};\n'.format(
-				self.legend_entry.replace('_', '\\_'))
+			self._raster = Image(image, axes=self.axes, limits=limits, attach=False,
+				vmin=0., vmax=max(counts), pgf_options=['forget plot'])
+			self._raster_key = key
+
+		return self._raster
+
+
+	def _cycle_index(self):
+		"""
+		Returns the position of this plot in the cycle list, i.e., the number
+		of preceding plots in the axes which are not excluded by C{forget plot}.
+		"""
+
+		from boxplot import BoxPlot
+		from surfplot import SurfPlot
+		from image import Image
+
+		index = 0
+
+		for child in self.axes.children:
+			if child is self:
+				break
+			if isinstance(child, (Plot, SurfPlot)):
+				index += 1
+			elif isinstance(child, Image):
+				index += 'forget plot' not in child.pgf_options
+			elif isinstance(child, BoxPlot):
+				index += child._num_plots()
+
+		return index
+
+
+	def _cycle_color(self):
+		"""
+		Returns the color PGFPlots picks for this plot from the cycle list, so
+		that rasterized marks look like marks drawn by PGFPlots.
+		"""
+
+		index = self._cycle_index()
+
+		if self.axes.cycle_list:
+			entries = self.axes.cycle_list[:]
+			args, kwargs = entries[index % len(entries)]
+
+			for color in [kwargs.get('fill', None), kwargs.get('color', None)] + list(args):
+				if isinstance(color, RGB) or parse_color(color) is not None:
+					return color
+			return 'black'
+
+		# other cycle lists are approximated by the default cycle list
+		return cycle_colors[index % len(cycle_colors)]
+
+
+	def _rasterize(self):
+		"""
+		Returns true if the marks of this plot are rendered into an image.
+		Only plots without lines are rasterized.
+		"""
+
+		rasterize = self.rasterize if self.rasterize is not None else Settings.rasterize
+
+		if not rasterize or not self.marker or self.line_style or not len(self.xvalues):
+			return False
+		if rasterize == 'auto':
+			return len(self.xvalues) > Settings.rasterize_threshold
+		return True
+
+
+	def _load(self):
+		"""
+		Parses the columns of the CSV file which have not been parsed yet.
+		"""
+
+		if not self._pending:
+			return
+
+		names = [name for name in self._pending if name in self._table_columns]
+		values = self._table.read([self._table_columns[name] for name in names])
+
+		for name, column in zip(names, values):
+			object.__setattr__(self, name, column)
+		if 'xvalues' not in names:
+			object.__setattr__(self, 'xvalues', arange(1, len(self.yvalues) + 1))
+
+		self._pending = []
+
+
+	def _passthrough(self):
+		"""
+		Returns true if PGFPlots reads the data points from the CSV file they
+		were given in, which is the case unless values have to be transformed.
+		"""
+
+		if self._table is None or self.downsample or self.labels or self._rasterize():
+			return False
+		if self.data_table is False or self.axes.data_tables is False:
+			return False
+		return self.axes.digits()[:2] == [None, None]
+
+
+	def _shareable(self):
+		"""
+		Returns true if the data points of this plot can be stored in a table
+		shared with other plots, i.e., if the plot consists of x- and y-values
+		only and they are not transformed.
+		"""
+
+		return self._table is None \
+			and not self.downsample \
+			and not self.labels \
+			and not len(self.xvalues_error) \
+			and not len(self.yvalues_error) \
+			and len(self.xvalues) > 0 \
+			and not self._rasterize()
+
+
+	def _data_table(self):
+		"""
+		Returns true if the data points are stored in a separate file.
+		"""
 
-		return tex
+		if self._rasterize():
+			return False
+		if self._passthrough():
+			return True
+		if self.data_table is not None:
+			return self.data_table
+		if self.axes.data_tables is not None:
+			return self.axes.data_tables
+		return Settings.data_tables
 
 
 	def limits(self):
@@ -0,0 +1,140 @@
+from numpy import asarray, zeros, empty, where, abs, uint8, int8, int16
+from struct import pack
+from zlib import compressobj, crc32
+
+# PNG color types of supported image modes
+color_types = {
+	'L': 0,
+	'RGB': 2,
+	'P': 3,
+	'RGBA': 6,
+}
+
+# bytes per pixel of supported image modes
+pixel_sizes = {
+	'L': 1,
+	'RGB': 3,
+	'P': 1,
+	'RGBA': 4,
+}
+
+# number of bytes filtered at once
+filter_size = 1 << 20
+
+def write_png(filename, rows, size, mode, palette=None, compress_level=6):
+	"""
+	Writes a PNG file while its rows are still being computed, so that the
+	image never has to be kept in memory as a whole. Like libpng, a filter
+	is chosen for each row except for palette images.
+
+	@type  filename: string
+	@param filename: where the PNG file is stored
+
+	@type  rows: iterable
+	@param rows: blocks of consecutive rows as arrays of type uint8
+
+	@type  size: tuple
+	@param size: width and height of the image
+
+	@type  mode: string
+	@param mode: 'L', 'RGB', 'RGBA' or 'P' (palette indices)
+
+	@type  palette: array_like/None
+	@param palette: up to 256 RGB values used by mode 'P'
+
+	@type  compress_level: integer
+	@param compress_level: zlib compression level between 0 and 9
+	"""
+
+	if mode not in color_types:
+		raise ValueError('Unknown mode \'{0}\'.'.format(mode))
+
+	width, height = size
+
+	with open(filename, 'wb') as handle:
+		handle.write('\x89PNG\r\n\x1a\n')
+
+		_write_chunk(handle, 'IHDR',
+			pack('>IIBBBBB', width, height, 8, color_types[mode], 0, 0, 0))
+
+		if mode == 'P':
+			_write_chunk(handle, 'PLTE', asarray(palette, dtype=uint8).tobytes())
+
+		compressor = compressobj(compress_level)
+
+		# row preceding the current block
+		previous = zeros(width * pixel_sizes[mode], dtype=uint8)
+
+		for block in rows:
+			block = asarray(block, dtype=uint8).reshape(len(block), -1)
+			step = max([filter_size // (block.shape[1] or 1), 1])
+
+			for i in range(0, block.shape[0], step):
+				if mode == 'P':
+					# each row starts with its filter type (none)
+					data = zeros([block[i:i + step].shape[0], block.shape[1] + 1], dtype=uint8)
+					data[:, 1:] = block[i:i + step]
+				else:
+					data = _filter(block[i:i + step], previous, pixel_sizes[mode])
+				previous = block[i:i + step][-1]
+
+				compressed = compressor.compress(data.tobytes())
+				if compressed:
+					_write_chunk(handle, 'IDAT', compressed)
+
+		_write_chunk(handle, 'IDAT', compressor.flush())
+		_write_chunk(handle, 'IEND', '')
+
+
+
+def _filter(block, previous, bpp):
+	"""
+	Filters each row with the filter type minimizing the sum of absolute
+	values of the filtered bytes, interpreted as signed bytes.
+
+	@type  block: ndarray
+	@param block: consecutive rows of type uint8
+
+	@type  previous: ndarray
+	@param previous: row preceding the block (zeros for the first row)
+
+	@type  bpp: integer
+	@param bpp: bytes per pixel
+
+	@rtype: ndarray
+	@return: filtered rows, each starting with its filter type
+	"""
+
+	x = block.astype(int16)
+
+	# bytes above, to the left and to the upper left
+	b = empty(x.shape, dtype=int16)
+	b[0] = previous
+	b[1:] = x[:-1]
+	a = zeros(x.shape, dtype=int16)
+	a[:, bpp:] = x[:, :-bpp]
+	c = zeros(x.shape, dtype=int16)
+	c[:, bpp:] = b[:, :-bpp]
+
+	# Paeth predictor
+	pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - 2 * c)
+	paeth = where((pa <= pb) & (pa <= pc), a, where(pb <= pc, b, c))
+
+	# none, sub, up, average and Paeth
+	candidates = [block] + [(x - p).astype(uint8) for p in [a, b, (a + b) // 2, paeth]]
+	costs = [abs(candidate.view(int8).astype(int16)).sum(1) for candidate in candidates]
+
+	best = asarray(costs).argmin(0)
+
+	data = empty([x.shape[0], x.shape[1] + 1], dtype=uint8)
+	data[:, 0] = best
+	for i, candidate in enumerate(candidates):
+		data[best == i, 1:] = candidate[best == i]
+
+	return data
+
+
+def _write_chunk(handle, tag, data):
+	handle.write(pack('>I', len(data)))
+	handle.write(tag + data)
+	handle.write(pack('>I', crc32(tag + data) & 0xffffffff))
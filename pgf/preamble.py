@@ -0,0 +1,78 @@
+from os import path, makedirs, rename, remove, system, getpid
+from hashlib import sha1
+from settings import Settings
+
+# names of formats which could not be built in this session
+_failed = set()
+
+def format_name(preamble):
+	"""
+	Returns the name of the precompiled format for a preamble.
+
+	@type  preamble: string
+	@param preamble: LaTeX code loading packages and defining macros
+
+	@rtype: string
+	@return: name of the format file without extension
+	"""
+
+	if isinstance(preamble, unicode):
+		preamble = preamble.encode('utf-8')
+	return 'pgf_' + sha1(preamble + Settings.pdf_format_compile).hexdigest()[:16]
+
+
+def format_directory():
+	"""
+	Returns the directory containing precompiled formats and makes sure it
+	exists.
+	"""
+
+	directory = path.join(Settings.tmp_dir, Settings.format_folder)
+	if not path.exists(directory):
+		makedirs(directory)
+	return directory
+
+
+def build_format(tex_file, preamble):
+	"""
+	Precompiles the preamble of a LaTeX file into a format, unless a format
+	for the same preamble already exists. Everything up to C{\\endofdump} is
+	stored in the format (see the documentation of the mylatexformat package).
+	Formats which could not be built are not attempted again in this session.
+
+	@type  tex_file: string
+	@param tex_file: LaTeX file containing the preamble
+
+	@type  preamble: string
+	@param preamble: preamble used to identify the format
+
+	@rtype: string/None
+	@return: name of the format or None if it could not be built
+	"""
+
+	directory = format_directory()
+	name = format_name(preamble)
+
+	if path.exists(path.join(directory, name + '.fmt')):
+		return name
+
+	if name in _failed:
+		return None
+
+	# build under a temporary name, so that other processes never see incomplete formats
+	jobname = '{0}_{1}'.format(name, getpid())
+
+	# the command is run inside the format directory
+	command = Settings.pdf_format_compile.format(jobname, path.abspath(tex_file))
+
+	if system('cd "{0}" && {1}'.format(directory, command)) \
+		or not path.exists(path.join(directory, jobname + '.fmt')):
+		_failed.add(name)
+		return None
+
+	rename(path.join(directory, jobname + '.fmt'), path.join(directory, name + '.fmt'))
+
+	if path.exists(path.join(directory, jobname + '.log')):
+		remove(path.join(directory, jobname + '.log'))
+
+	return name
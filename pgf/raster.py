@@ -0,0 +1,209 @@
+from numpy import asarray, histogram2d, zeros, arange, power, log10, errstate
+from numpy import ceil, round, max, uint8, clip
+from rgb import RGB
+from colormap import get_colormap
+
+# RGB values of basic colors
+colors = {
+	'red': (255, 0, 0),
+	'green': (0, 255, 0),
+	'blue': (0, 0, 255),
+	'cyan': (0, 255, 255),
+	'magenta': (255, 0, 255),
+	'yellow': (255, 255, 0),
+	'black': (0, 0, 0),
+	'white': (255, 255, 255),
+	'gray': (128, 128, 128),
+	'darkgray': (64, 64, 64),
+	'lightgray': (191, 191, 191),
+	'brown': (191, 128, 64),
+	'orange': (255, 128, 0),
+	'purple': (191, 0, 64),
+	'violet': (128, 0, 128),
+	'teal': (0, 128, 128),
+	'olive': (128, 128, 0),
+	'lime': (191, 255, 0),
+	'pink': (255, 191, 191),
+}
+
+# colors of marks in PGFPlots' default cycle list (cycle list name=color)
+cycle_colors = [
+	'blue!80!black',
+	'red!80!black',
+	'brown!80!black',
+	'black',
+	'blue!80!black',
+	'red!80!black',
+	'brown!80!black',
+	'gray',
+	'blue',
+	'red!80!black']
+
+def color_to_rgb(color, default='blue'):
+	"""
+	Converts a color specification into RGB values between 0 and 255.
+
+	B{Example:}
+
+		>>> color_to_rgb('red!50!black')
+		(128, 0, 0)
+
+	@type  color: string/L{RGB}/None
+	@param color: an RGB object, the name of a basic color or a mixture of
+	basic colors in xcolor notation
+
+	@type  default: string
+	@param default: color used if the specification is not understood
+
+	@rtype: tuple
+	@return: red, green and blue values
+	"""
+
+	if isinstance(color, RGB):
+		if color.type == int:
+			return (color.red, color.green, color.blue)
+		return tuple(int(round(c * 255.)) for c in [color.red, color.green, color.blue])
+
+	rgb = parse_color(color)
+
+	if rgb is None:
+		return colors[default]
+	return rgb
+
+
+def parse_color(color):
+	"""
+	Parses mixtures of basic colors in xcolor notation, e.g. 'blue!80!black'
+	(80% blue and 20% black). A trailing percentage mixes with white.
+
+	@rtype: tuple/None
+	@return: red, green and blue values or None if the color is not understood
+	"""
+
+	if not isinstance(color, str):
+		return None
+
+	parts = [part.strip() for part in color.split('!')]
+
+	if parts[0] not in colors:
+		return None
+
+	rgb = asarray(colors[parts[0]], dtype=float)
+
+	for i in range(1, len(parts), 2):
+		other = parts[i + 1] if i + 1 < len(parts) else 'white'
+
+		if other not in colors:
+			return None
+
+		try:
+			weight = float(parts[i]) / 100.
+		except ValueError:
+			return None
+
+		rgb = weight * rgb + (1. - weight) * asarray(colors[other], dtype=float)
+
+	return tuple(int(round(c)) for c in rgb)
+
+
+def count_marks(xvalues, yvalues, limits, shape, radius, log_scale=(False, False)):
+	"""
+	Computes how many marks cover each pixel of an image.
+
+	@type  xvalues: array_like
+	@param xvalues: x-coordinates of marks
+
+	@type  yvalues: array_like
+	@param yvalues: y-coordinates of marks
+
+	@type  limits: list
+	@param limits: [xmin, xmax, ymin, ymax] covered by the image
+
+	@type  shape: tuple
+	@param shape: height and width of the image in pixels
+
+	@type  radius: float
+	@param radius: radius of marks in pixels; marks are drawn as discs
+
+	@type  log_scale: tuple
+	@param log_scale: whether x- and y-axis are logarithmic
+
+	@rtype: ndarray
+	@return: number of marks covering each pixel, first row at the top
+	"""
+
+	xmin, xmax, ymin, ymax = limits
+	xvalues = asarray(xvalues, dtype=float)
+	yvalues = asarray(yvalues, dtype=float)
+
+	with errstate(divide='ignore', invalid='ignore'):
+		if log_scale[0]:
+			xvalues, xmin, xmax = log10(xvalues), log10(xmin), log10(xmax)
+		if log_scale[1]:
+			yvalues, ymin, ymax = log10(yvalues), log10(ymin), log10(ymax)
+
+	# number of marks centered in each pixel
+	counts, _, _ = histogram2d(yvalues, xvalues,
+		bins=shape, range=[[ymin, ymax], [xmin, xmax]])
+	counts = counts[::-1]
+
+	# spread marks over discs
+	r = int(ceil(radius - 0.5))
+	if r < 1:
+		return counts
+
+	height, width = shape
+	padded = zeros([height + 2 * r, width + 2 * r])
+	for i in arange(-r, r + 1):
+		for j in arange(-r, r + 1):
+			if i * i + j * j <= radius * radius:
+				padded[r + i:r + i + height, r + j:r + j + width] += counts
+
+	return padded[r:r + height, r:r + width]
+
+
+def render_marks(counts, color, opacity=1.):
+	"""
+	Turns mark counts into an RGBA image in which overlapping marks are blended
+	the same way as transparent vector marks.
+
+	@type  counts: ndarray
+	@param counts: number of marks covering each pixel
+
+	@type  color: tuple
+	@param color: RGB values between 0 and 255
+
+	@type  opacity: float
+	@param opacity: opacity of a single mark
+
+	@rtype: ndarray
+	@return: image with four channels
+	"""
+
+	image = zeros(counts.shape + (4,), dtype=uint8)
+	image[:, :, :3] = color
+	image[:, :, 3] = round(255. * (1. - power(1. - opacity, counts)))
+	return image
+
+
+def render_density(counts, cmap='jet'):
+	"""
+	Maps mark counts to colors. Pixels not covered by any mark are transparent.
+
+	@type  counts: ndarray
+	@param counts: number of marks covering each pixel
+
+	@type  cmap: string
+	@param cmap: name of a colormap in L{colormaps}
+
+	@rtype: ndarray
+	@return: image with four channels
+	"""
+
+	lut = get_colormap(cmap).lut
+	indices = clip(counts / float(max([max(counts), 1.]) / 256.), 0, 255).astype(int)
+
+	image = zeros(counts.shape + (4,), dtype=uint8)
+	image[:, :, :3] = lut[indices]
+	image[:, :, 3] = 255 * (counts > 0)
+	return image
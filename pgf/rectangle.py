@@ -1,7 +1,7 @@
 from axes import Axes
-from utils import indent
+from utils import indent, Tracked
 
-class Rectangle(object):
+class Rectangle(Tracked):
 	def __init__(self, x, y, dx, dy, **kwargs):
 		self.x = x
 		self.y = y
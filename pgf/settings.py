@@ -7,6 +7,33 @@ class Settings(object):
 	# how to compile LaTeX code into PDFs
 	pdf_compile = 'pdflatex -halt-on-error -interaction batchmode {0} > /dev/null'
 
+	# reuse PDFs of previously compiled figures if nothing has changed
+	cache = True
+
+	# where compiled figures are cached (relative to tmp_dir) and maximum size in bytes
+	cache_folder = 'pgf_cache'
+	cache_size = 200 * 1024 * 1024
+
+	# precompile the preamble into a format (requires the mylatexformat package)
+	precompile_preamble = False
+
+	# how to build formats and where to store them (relative to tmp_dir)
+	pdf_format_compile = 'pdflatex -ini -halt-on-error -interaction batchmode -jobname={0} "&pdflatex" mylatexformat.ltx "{1}" > /dev/null'
+	format_folder = 'pgf_formats'
+
+	# keep a TeX process with loaded preamble waiting for the next figure
+	tex_worker = False
+
+	# how to start TeX processes waiting for figures
+	pdf_worker = 'pdflatex -halt-on-error -jobname={0} {1} > /dev/null'
+
+	# compile each axes separately and reuse PDFs of unchanged axes
+	externalize = False
+
+	# reuse LaTeX code of plots which did not change since they were last rendered
+	# (arrays changed in place are not noticed unless touch() is called on the plot)
+	fragment_cache = False
+
 	# how to open and show PDFs
 	pdf_view_mac = 'open {0}'
 	pdf_view_linux = 'evince --preview {0} &'
@@ -17,6 +44,39 @@ class Settings(object):
 	image_folder = 'images'
 	image_format = 'PNG'
 
+	# if set, images are downsampled to this resolution (in dots per inch) before they are stored
+	image_dpi = None
+
+	# options passed to PIL when saving images, e.g. {'compress_level': 1} or {'quality': 90}
+	image_options = {}
+
+	# plots with more data points are formatted by multiple processes
+	format_threshold = 1000000
+
+	# number of processes formatting data points (default: number of CPUs)
+	format_processes = None
+
+	# number of threads encoding images (default: number of CPUs)
+	image_threads = None
+
+	# if true, plot data is stored in separate files and read with \addplot table
+	data_tables = False
+
+	# where data tables used in the figures will be stored
+	data_folder = 'data'
+
+	# significant digits of data points; an integer, 'auto' or None (full precision)
+	precision = None
+
+	# resolution in dots per inch assumed for the output
+	dpi = 300
+
+	# render marks of scatter plots into images; True, False or 'auto'
+	rasterize = False
+
+	# in 'auto' mode, scatter plots with more data points are rasterized
+	rasterize_threshold = 10000
+
 	# will be included in header of LaTeX file
 	preamble = \
 		'\\usepackage[utf8]{inputenc}\n' + \
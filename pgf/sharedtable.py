@@ -0,0 +1,153 @@
+from coordinates import format_coordinates, write_coordinates
+from settings import Settings
+from utils import Tracked
+from os import path, rename, getpid
+from hashlib import sha1
+from threading import current_thread
+
+class SharedTable(Tracked):
+	"""
+	Data points of plots with equal x-values, stored in a single table with
+	one column of x-values and one column of y-values per plot. The table is
+	written once, either inline using C{\\pgfplotstableread} or into a
+	separate file, and each plot reads its own column.
+
+	@type plots: list
+	@ivar plots: plots sharing this table
+
+	@type name: string
+	@ivar name: name of the macro holding the table
+	"""
+
+	def __init__(self, plots, name):
+		self.plots = plots
+		self.name = name
+
+		# versions of the plots when the table was created
+		self._versions = [plot._version for plot in plots]
+
+
+	def column(self, plot):
+		"""
+		Returns the name of the column containing the y-values of a plot.
+		"""
+
+		return 'y{0}'.format(self.plots.index(plot))
+
+
+	def data_table(self):
+		"""
+		Returns true if the table is stored in a separate file.
+		"""
+
+		return self.plots[0]._data_table()
+
+
+	def source(self):
+		"""
+		Returns what PGFPlots reads the table from, i.e., the macro or file.
+		"""
+
+		if self.data_table():
+			return path.join(Settings.data_folder, self.filename())
+		return '\\' + self.name
+
+
+	def filename(self):
+		"""
+		Returns a filename derived from the data points of the plots and their
+		precision, so that identical tables are stored only once.
+		"""
+
+		digest = sha1('{0}:'.format(self.plots[0].axes.digits()[:2]))
+		for plot in self.plots:
+			digest.update(plot._data_digest())
+
+		return digest.hexdigest()[:20] + '.dat'
+
+
+	def render_to(self, writer):
+		"""
+		Writes the LaTeX code defining the table, unless it is stored in a
+		separate file.
+
+		@type  writer: L{Writer}
+		@param writer: keeps track of the output stream and indentation
+		"""
+
+		if self.data_table():
+			return
+
+		names, columns, precision = self._columns()
+
+		writer.write('\\pgfplotstableread{\n')
+		writer.indent()
+		writer.write('\t'.join(names) + '\n')
+		write_coordinates(writer, columns, '\t'.join(['{}'] * len(names)) + '\n', precision)
+		writer.dedent()
+		writer.write('}}\\{0}\n'.format(self.name))
+
+
+	def save(self, filepath=''):
+		"""
+		Writes the table into a tab-separated file, unless a file with the same
+		content already exists.
+
+		@type  filepath: string
+		@param filepath: directory in which the table will be stored
+		"""
+
+		filename = path.join(filepath, self.filename())
+
+		if path.exists(filename):
+			return
+
+		names, columns, precision = self._columns()
+		template = '\t'.join(['{}'] * len(names)) + '\n'
+
+		# write to temporary file first, so that incomplete files are never reused
+		tmp_file = '{0}.{1}.{2}.tmp'.format(filename, getpid(), current_thread().ident)
+
+		with open(tmp_file, 'w') as handle:
+			handle.write('\t'.join(names) + '\n')
+			for chunk in format_coordinates(columns, template, precision=precision):
+				handle.write(chunk)
+
+		rename(tmp_file, filename)
+
+
+	def _columns(self):
+		"""
+		Returns names, values and significant digits of the columns.
+
+		@rtype: tuple
+		@return: lists of column names, columns and digits
+		"""
+
+		xdigits, ydigits, _ = self.plots[0].axes.digits()
+
+		names = ['x'] + [self.column(plot) for plot in self.plots]
+		columns = [self.plots[0].xvalues] + [plot.yvalues for plot in self.plots]
+		digits = [xdigits] + [ydigits] * len(self.plots)
+
+		return names, columns, digits
+
+
+
+def table_name(index):
+	"""
+	Returns a name for the index-th table of an axes which can be used as a
+	macro name, i.e., which consists of letters only.
+
+	B{Example:}
+
+		>>> table_name(27)
+		'pgftableab'
+	"""
+
+	letters = ''
+	index += 1
+	while index:
+		index, remainder = divmod(index - 1, 26)
+		letters = chr(ord('a') + remainder) + letters
+	return 'pgftable' + letters
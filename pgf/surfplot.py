@@ -1,7 +1,9 @@
 from axes import Axes
-from numpy import meshgrid, arange
+from numpy import meshgrid, arange, ravel, min, max
+from utils import render_string, Tracked
+from coordinates import write_coordinates
 
-class SurfPlot(object):
+class SurfPlot(Tracked):
 	"""
 	Renders basic 3D surfaces.
 	"""
@@ -37,6 +39,10 @@ class SurfPlot(object):
 
 
 	def render(self):
+		return render_string(self)
+
+
+	def render_to(self, writer):
 		options = ['surf']
 		options.append('mesh/rows={0}'.format(self.zvalues.shape[0]))
 
@@ -45,11 +51,16 @@ class SurfPlot(object):
 
 		options_string = ','.join(options)
 
-		tex = '\\addplot3[{0}] coordinates {{\n'.format(options_string)
-		for i in range(self.zvalues.shape[0]):
-			for j in range(self.zvalues.shape[1]):
-				tex += '\t({0}, {1}, {2})\n'.format(
-					self.xvalues[i, j], self.yvalues[i, j], self.zvalues[i, j])
-		tex += '};\n'
+		writer.write('\\addplot3[{0}] coordinates {{\n'.format(options_string))
+		write_coordinates(writer,
+			[ravel(self.xvalues), ravel(self.yvalues), ravel(self.zvalues)],
+			'\t({0}, {1}, {2})\n', self.axes.digits())
+		writer.write('};\n')
+
 
-		return tex
+	def limits(self):
+		return [
+			min(self.xvalues),
+			max(self.xvalues),
+			min(self.yvalues),
+			max(self.yvalues)]
@@ -1,6 +1,7 @@
 from axes import Axes
+from utils import indent, Tracked
 
-class Text(object):
+class Text(Tracked):
 	def __init__(self, x, y, text, **kwargs):
 		self.x = x
 		self.y = y
@@ -1,5 +1,7 @@
-from numpy import min, max, iterable
+from numpy import min, max, iterable, isfinite, log, log10, floor, ceil, clip, asarray
 from string import rstrip
+from StringIO import StringIO
+from settings import Settings
 
 def indent(text, times=1, ind='\t'):
 	"""
@@ -20,12 +22,195 @@ def indent(text, times=1, ind='\t'):
 	return '\n'.join([rstrip(ind + line) for line in text.split('\n')])
 
 
+class Writer(object):
+	"""
+	Writes LaTeX code to a file-like object while keeping track of the current
+	indentation, so that nested objects can be rendered without building and
+	re-indenting intermediate strings.
+
+	@type stream: file
+	@ivar stream: file-like object the code is written to
+
+	@type level: integer
+	@ivar level: current number of indentations
+
+	@type ind: string
+	@ivar ind: string inserted at the beginning of each line per indentation
+	"""
+
+	def __init__(self, stream, level=0, ind='\t'):
+		self.stream = stream
+		self.level = level
+		self.ind = ind
+
+		# true if the next character written starts a new line
+		self._newline = True
+
+
+	def write(self, text):
+		"""
+		Writes text, indenting every line which is not empty.
+
+		@type  text: string
+		@param text: some text
+		"""
+
+		prefix = self.ind * self.level
+
+		for line in text.splitlines(True):
+			if self._newline:
+				if line.strip():
+					self.stream.write(prefix)
+				else:
+					# like indent(), don't leave whitespace on empty lines
+					line = line.lstrip(' \t')
+			self.stream.write(line)
+			self._newline = line.endswith('\n')
+
+
+	def write_raw(self, text):
+		"""
+		Writes text without indenting it, e.g. lines which already start with
+		L{prefix}.
+
+		@type  text: string
+		@param text: some text
+		"""
+
+		self.stream.write(text)
+		self._newline = text.endswith('\n')
+
+
+	@property
+	def prefix(self):
+		"""
+		String inserted at the beginning of each line at the current level.
+		"""
+
+		return self.ind * self.level
+
+
+	def indent(self, times=1):
+		self.level += times
+
+
+	def dedent(self, times=1):
+		self.level -= times
+
+
+class Tracked(object):
+	"""
+	Counts assignments to public attributes, so that LaTeX code rendered for an
+	object can be reused until the object changes. Changes made in place, e.g.
+	to the values of an array, are not noticed and require a call to
+	L{touch}.
+	"""
+
+	# incremented whenever a public attribute is assigned
+	_version = 0
+
+	def __setattr__(self, name, value):
+		if not name.startswith('_'):
+			object.__setattr__(self, '_version', self._version + 1)
+		object.__setattr__(self, name, value)
+
+
+	def touch(self):
+		"""
+		Marks the object as changed.
+		"""
+
+		self._version += 1
+
+
+def hash_values(digest, values, chunk_size=1 << 20):
+	"""
+	Feeds values into a hash object, including their type and shape. Arrays
+	are hashed in chunks, so that non-contiguous arrays, e.g. fields of
+	memory-mapped records, are never copied as a whole.
+
+	@type  digest: hash object
+	@param digest: e.g. C{hashlib.sha1()}
+
+	@type  values: array_like/list
+	@param values: an array or a list of strings
+
+	@type  chunk_size: integer
+	@param chunk_size: number of values hashed at once
+	"""
+
+	if isinstance(values, list):
+		digest.update('list:{0}:'.format(len(values)))
+		digest.update('\n'.join(str(value) for value in values))
+		return
+
+	values = asarray(values)
+	digest.update('{0}:{1}:'.format(values.dtype.str, values.shape))
+
+	values = values.reshape(-1)
+	for i in range(0, values.size, chunk_size):
+		digest.update(values[i:i + chunk_size].tobytes())
+
+
+
+def render_string(obj, *args, **kwargs):
+	"""
+	Renders an object implementing C{render_to()} into a string.
+
+	@rtype: string
+	@return: LaTeX code for the given object
+	"""
+
+	stream = StringIO()
+	obj.render_to(Writer(stream), *args, **kwargs)
+	return stream.getvalue()
+
+
 def min_free(indices):
 	if not indices:
 		return 0
 	return min(list(set(range(max(indices) + 2)).difference(indices)))
 
 
+def significant_digits(vmin, vmax, size, log_scale=False):
+	"""
+	Computes the number of significant digits needed to resolve values within
+	an axis range.
+
+	@type  vmin: float/None
+	@param vmin: lower limit of the axis
+
+	@type  vmax: float/None
+	@param vmax: upper limit of the axis
+
+	@type  size: float
+	@param size: physical size of the axis in cm
+
+	@type  log_scale: boolean
+	@param log_scale: whether the axis is logarithmic
+
+	@rtype: integer/None
+	@return: number of significant digits or None if it cannot be determined
+	"""
+
+	if vmin is None or vmax is None or not isfinite(vmin) or not isfinite(vmax) or vmax <= vmin:
+		return None
+
+	# size of a tenth of a dot on the axis
+	dots = size / 2.54 * Settings.dpi * 10.
+
+	if log_scale:
+		if vmin <= 0.:
+			return None
+		step = (log10(vmax) - log10(vmin)) / dots * log(10.)
+		digits = int(ceil(-log10(step))) + 1
+	else:
+		step = (vmax - vmin) / dots
+		digits = int(floor(log10(max([abs(vmin), abs(vmax)]))) - floor(log10(step))) + 1
+
+	return int(clip(digits, 1, 17))
+
+
 def escape(string):
 	"""
 	If string contains commas, put curly braces around the string. If string
@@ -0,0 +1,154 @@
+from os import path, remove, rename, getpid
+from subprocess import Popen, PIPE
+from atexit import register
+from settings import Settings
+
+class Worker(object):
+	"""
+	A TeX process which has already loaded the preamble and waits for the name
+	of a LaTeX file on its standard input. The preamble of that file is skipped
+	up to C{\\csname endofdump\\endcsname}, the rest is compiled into a PDF.
+
+	Each process compiles a single figure. A new process is started right
+	away, so that the next figure can be compiled without waiting for TeX to
+	start and load its packages.
+
+	The header is skipped by a redefined C{\\documentclass}, which has to be
+	C{\\long} since the header contains empty lines (i.e., paragraphs).
+	"""
+
+	# worker waiting for the next figure
+	_worker = None
+
+	_counter = 0
+
+	@staticmethod
+	def run(preamble, directory, tex_file, pdf_file):
+		"""
+		Compiles a LaTeX file using a warm worker and starts a new worker for
+		the next figure.
+
+		@type  preamble: string
+		@param preamble: preamble of the LaTeX file
+
+		@type  directory: string
+		@param directory: directory in which the LaTeX file is compiled
+
+		@type  tex_file: string
+		@param tex_file: LaTeX file containing C{\\csname endofdump\\endcsname}
+
+		@type  pdf_file: string
+		@param pdf_file: where the resulting PDF file will be stored
+		"""
+
+		worker = Worker._worker
+		Worker._worker = None
+
+		if worker is None or not worker.ready(preamble, directory):
+			# preamble changed or process terminated
+			if worker is not None:
+				worker.close()
+			worker = Worker(preamble, directory)
+
+		success = worker.compile(tex_file, pdf_file)
+
+		# warm up worker for the next figure
+		Worker._worker = Worker(preamble, directory)
+
+		if not success:
+			raise RuntimeError('Compiling TeX source file to PDF failed.')
+
+
+	@staticmethod
+	def shutdown():
+		"""
+		Terminates the waiting worker.
+		"""
+
+		if Worker._worker is not None:
+			Worker._worker.close()
+			Worker._worker = None
+
+
+	def __init__(self, preamble, directory):
+		self.preamble = preamble
+		self.directory = directory
+
+		self.jobname = 'pgf_worker_{0}_{1}'.format(getpid(), Worker._counter)
+		Worker._counter += 1
+
+		driver_file = path.join(directory, self.jobname + '.tex')
+
+		with open(driver_file, 'w') as handle:
+			handle.write(
+				'\\documentclass{article}\n' + \
+				'\n' + \
+				preamble + \
+				'\n' + \
+				'\\long\\def\\documentclass#1\\csname endofdump\\endcsname{}\n' + \
+				'{\\endlinechar=-1 \\global\\readline16 to \\pgfworkerfile}\n' + \
+				'\\input{\\pgfworkerfile}\n')
+
+		self.process = Popen(
+			'exec ' + Settings.pdf_worker.format(self.jobname, driver_file),
+			shell=True, cwd=directory, stdin=PIPE)
+
+
+	def ready(self, preamble, directory):
+		"""
+		Returns true if the worker is still waiting and can compile a LaTeX file
+		with the given preamble in the given directory.
+		"""
+
+		return self.process.poll() is None \
+			and self.preamble == preamble \
+			and self.directory == directory
+
+
+	def compile(self, tex_file, pdf_file):
+		"""
+		Hands a LaTeX file over to TeX and waits for the PDF file.
+
+		@rtype: boolean
+		@return: true if the PDF file was created
+		"""
+
+		try:
+			self.process.stdin.write(tex_file + '\n')
+			self.process.stdin.close()
+		except IOError:
+			# process has terminated
+			pass
+
+		output_file = path.join(self.directory, self.jobname + '.pdf')
+
+		success = self.process.wait() == 0 and path.exists(output_file)
+
+		if success:
+			rename(output_file, pdf_file)
+
+		self._cleanup()
+
+		return success
+
+
+	def close(self):
+		"""
+		Terminates the process.
+		"""
+
+		if self.process.poll() is None:
+			self.process.kill()
+			self.process.wait()
+		self._cleanup()
+
+
+	def _cleanup(self):
+		for extension in ['.tex', '.aux', '.log', '.pdf']:
+			filename = path.join(self.directory, self.jobname + extension)
+			if path.exists(filename):
+				remove(filename)
+
+
+
+register(Worker.shutdown)